@@ -4,10 +4,17 @@
 # Released under a "Simplified BSD" license
 
 
-import random, pygame, sys
-from pygame.locals import *
+import argparse, bisect, csv, functools, heapq, json, math, os, queue, random, statistics, struct, sys, threading, time, zlib
+from array import array
+from collections import Counter, deque
+
+pygame = None # imported by loadPygame() once something is drawn; the game rules never need it
 
 FPS = 15
+TICKRATE = FPS # game logic updates per second while playing
+RENDERFPS = 60 # frames drawn per second while playing (0 = as fast as possible)
+MAXTICKSPERFRAME = 5 # ticks caught up in one frame before the game slows down instead
+MAXQUEUEDTURNS = 3 # direction changes buffered ahead of the ticks that apply them
 WINDOWWIDTH = 640
 WINDOWHEIGHT = 480
 CELLSIZE = 20
@@ -15,6 +22,11 @@ assert WINDOWWIDTH % CELLSIZE == 0, "Window width must be a multiple of cell siz
 assert WINDOWHEIGHT % CELLSIZE == 0, "Window height must be a multiple of cell size."
 CELLWIDTH = int(WINDOWWIDTH / CELLSIZE)
 CELLHEIGHT = int(WINDOWHEIGHT / CELLSIZE)
+BOARDWIDTH = CELLWIDTH # board size in cells; a board bigger than the window scrolls
+BOARDHEIGHT = CELLHEIGHT
+MINBOARDSIZE = 11 # worms start at least 5 cells from every edge, so a smaller board has nowhere to put them
+CHUNKCELLS = 16 # the background grid is drawn in cached chunks of this many cells square
+CAMERA = (0, 0) # board pixel drawn at the window's top left corner, set while playing
 
 #             R    G    B
 WHITE     = (255, 255, 255)
@@ -28,8 +40,38 @@ BLUE      = (  0,   0, 255)      # Color for second worm
 YELLOW    = (255, 255,   0)      # Color for first blinking element
 CYAN      = (  0, 255, 255)      # Color for second blinking element
 PURPLE    = (128,   0, 128)      # Color for poisonous apples
+# Added colors for more AI worms
+ORANGE    = (255, 140,   0)
+PEACH     = (255, 200, 120)
+MAROON    = (128,   0,   0)
+PINK      = (255, 105, 180)
+GRAY      = (128, 128, 128)
+SILVER    = (200, 200, 200)
 BGCOLOR = BLACK
 
+DIRTYRECTS = True # repaint only the cells that changed each frame instead of the whole window
+
+FONTSIZES = (14, 18, 36, 100, 150) # every font size the game uses, loaded once in main()
+TEXTCACHESIZE = 64 # rendered text surfaces kept by renderText()
+
+PROFILEPATH = None # write each game's phase timings here: Chrome trace JSON, or CSV for a .csv path
+PROFILEWINDOW = 600 # latest samples of each phase the rolling percentiles are taken over
+PROFILETRACE = 200000 # latest timed phases kept for the trace file
+PROFILEREFRESH = 500 # milliseconds between updates of the F3 profiler overlay
+PROFILELINES = 10 # slowest phases listed on the overlay
+
+NUMAIWORMS = 1 # AI worms that join the game 20 seconds in
+# (outer, inner) colors of the AI worms, handed out in turn as they spawn
+AIWORMPALETTE = ((BLUE, CYAN), (ORANGE, PEACH), (MAROON, PINK), (GRAY, SILVER))
+
+# Cell graphics pre-rendered into the tile atlas: (outer color, inner color or None)
+TILES = {'worm':       (DARKGREEN, GREEN),
+         'apple':      (RED,       None),
+         'poison':     (PURPLE,    None),
+         'blink1':     (YELLOW,    None),
+         'blink2':     (CYAN,      None)}
+TILES.update(('aiWorm%d' % i, colors) for i, colors in enumerate(AIWORMPALETTE))
+
 UP = 'up'
 DOWN = 'down'
 LEFT = 'left'
@@ -37,15 +79,48 @@ RIGHT = 'right'
 
 HEAD = 0 # syntactic sugar: index of the worm's head
 
-def main():
-    global FPSCLOCK, DISPLAYSURF, BASICFONT
+KEYDIRECTIONS = {} # key code -> direction, filled in by loadPygame()
 
-    pygame.init()
-    FPSCLOCK = pygame.time.Clock()
-    DISPLAYSURF = pygame.display.set_mode((WINDOWWIDTH, WINDOWHEIGHT))
-    BASICFONT = pygame.font.Font('freesansbold.ttf', 18)
-    pygame.display.set_caption('Wormy')
+# Cell offset of one move in each direction, and the direction it can't reverse into
+DIRECTIONDELTAS = {UP: (0, -1), DOWN: (0, 1), LEFT: (-1, 0), RIGHT: (1, 0)}
+OPPOSITE = {UP: DOWN, DOWN: UP, LEFT: RIGHT, RIGHT: LEFT}
+
+# Order in which WormyEngine's timed events run when they fall on the same tick
+EVENTORDER = ('spawnAIWorm', 'spawnApple', 'expireType1', 'spawnType1',
+              'spawnType2', 'expireType2', 'spawnPoison', 'expirePoison')
+
+SPAWNATTEMPTS = 8 # free cells tried per tick when a spawn needs more than one cell
+
+AIPATHFINDING = True # AI worms head for the apple instead of wandering at random
+AIBUDGET = 1500 # distance field cells settled per tick at most; the rest carries over
+HEADLESSPATHFINDING = False # AI worms of --headless and --batch games pathfind too; it costs up to AIBUDGET cells a tick
 
+REPLAYDIR = None # directory to save a replay of every game played in, or None
+REPLAYSNAPSHOTS = False # also save a snapshot every SNAPSHOTINTERVAL ticks, so seeking a saved replay never re-simulates from tick 0
+SNAPSHOTINTERVAL = TICKRATE * 10 # ticks between the state snapshots that make replays seekable
+
+# WormyEngine.snapshot() layout: a fixed header, then the RNG's Mersenne
+# Twister words and the variable-length arrays whose sizes the header holds
+DIRECTIONCODES = (UP, DOWN, LEFT, RIGHT, None)
+GAMEOVERCODES = (None, 'poison')
+SNAPSHOTHEADER = struct.Struct('<IIidiBBBBBBiiiiiiBdIIIIIII')
+RNGWORDS = struct.Struct('<625I')
+# DistanceField.tobytes() layout: target cell and the sizes of its work queues
+FIELDHEADER = struct.Struct('<iIIII')
+REWINDSECONDS = 3 # how far back BACKSPACE can take the game, one second per press
+REWINDMEMORY = 64 * 1024 * 1024 # bytes of snapshots kept for rewinding; big boards rewind less, or not at all
+
+# Clockwise quarter turn from each direction; a recorded turn is one bit
+CLOCKWISE = {UP: RIGHT, RIGHT: DOWN, DOWN: LEFT, LEFT: UP}
+
+BATCHMAXTICKS = TICKRATE * 60 * 10 # a headless game still running after 10 minutes ends as 'timeout'
+
+CAPTUREDIR = None # directory to save a video of every game played in, or None
+CAPTUREFORMAT = 'png' # 'png' for a numbered PNG per frame, 'raw' for one uncompressed video stream
+CAPTUREBUFFERS = 32 # captured frames waiting to be written before new ones are dropped
+
+def main():
+    initDisplay()
     showStartScreen()
     while True:
         # Capture return values from runGame
@@ -57,339 +132,1824 @@ def main():
             showGameOverScreen()
 
 
+def initDisplay():
+    global FPSCLOCK, DISPLAYSURF, BASICFONT, TILEATLAS
+
+    loadPygame()
+    # Only the subsystems the game uses: it makes no sound, so the mixer stays off
+    pygame.display.init()
+    pygame.font.init()
+    FPSCLOCK = pygame.time.Clock()
+    DISPLAYSURF = pygame.display.set_mode((WINDOWWIDTH, WINDOWHEIGHT))
+    for size in FONTSIZES:
+        getFont(size)
+    BASICFONT = getFont(18)
+    TILEATLAS = TileAtlas()
+    pygame.display.set_caption('Wormy')
+
+
+# Added lazy pygame loading
+def loadPygame():
+    """
+    Import pygame the first time something is drawn. Headless games,
+    batches, replays and the server only run the rules, so they start
+    without paying for pygame and the numpy it pulls in.
+    """
+    global pygame
+    if pygame is None:
+        import pygame
+        KEYDIRECTIONS.update({pygame.K_LEFT: LEFT, pygame.K_a: LEFT, pygame.K_RIGHT: RIGHT, pygame.K_d: RIGHT,
+                              pygame.K_UP: UP, pygame.K_w: UP, pygame.K_DOWN: DOWN, pygame.K_s: DOWN})
+    return pygame
+
+
+# Added command line entry point
+def runCommandLine(argv):
+    global REPLAYDIR, REPLAYSNAPSHOTS, NUMAIWORMS, BOARDWIDTH, BOARDHEIGHT, PROFILEPATH, CAPTUREDIR, CAPTUREFORMAT
+    parser = argparse.ArgumentParser(description='Wormy (a Nibbles clone)')
+    parser.add_argument('--headless', action='store_true',
+                        help='play one game with --bot at the controls and no window, and print its result')
+    parser.add_argument('--batch', type=positiveInt, metavar='GAMES',
+                        help='play this many headless games and print score distributions')
+    parser.add_argument('--workers', type=positiveInt, default=None,
+                        help='processes for --batch (default: one per CPU)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the --headless game, or base seed for --batch; game i plays seed "SEED-i"')
+    parser.add_argument('--max-ticks', type=int, default=BATCHMAXTICKS,
+                        help='ticks after which a --headless or --batch game is stopped')
+    parser.add_argument('--csv', metavar='PATH',
+                        help='also write one row per --batch game to this CSV file')
+    parser.add_argument('--bot', choices=sorted(BOTS), default='greedy',
+                        help='what steers the player worm in --headless and --batch games')
+    parser.add_argument('--ai-worms', type=int, default=NUMAIWORMS, metavar='N',
+                        help='AI worms that join each game after 20 seconds')
+    parser.add_argument('--ai-pathfinding', action='store_true', default=HEADLESSPATHFINDING,
+                        help='AI worms of --headless and --batch games head for the apple instead of wandering '
+                             '(much slower)')
+    parser.add_argument('--board', type=boardSize, default=(BOARDWIDTH, BOARDHEIGHT), metavar='WxH',
+                        help='board size in cells; boards bigger than the window scroll')
+    parser.add_argument('--record', metavar='DIR',
+                        help='save a replay of every game played into this directory')
+    parser.add_argument('--record-snapshots', action='store_true',
+                        help='store snapshots in --record replays: bigger files, but seeking is instant')
+    parser.add_argument('--replay', metavar='FILE',
+                        help='re-simulate a saved replay headlessly and print its result')
+    parser.add_argument('--capture', metavar='DIR',
+                        help='save a video of every game played, or of the --replay, into this directory')
+    parser.add_argument('--capture-format', choices=('png', 'raw'), default=CAPTUREFORMAT,
+                        help='a numbered PNG per frame, or one raw video file for ffmpeg')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='time every tick and frame phase and write them to PATH '
+                             '(Chrome trace JSON, or CSV if PATH ends in .csv)')
+    args = parser.parse_args(argv)
+
+    if args.headless:
+        game = playHeadlessGame(args.seed, args.max_ticks, args.bot, args.ai_worms, args.board, args.ai_pathfinding)
+        print('seed %(gameSeed)r: %(ticks)d ticks, %(gameOverReason)s, final score %(finalScore)d' % game)
+    elif args.batch is not None:
+        stats = runBatch(args.batch, args.workers, args.seed, args.max_ticks, args.csv, args.bot, args.ai_worms,
+                         args.board, args.ai_pathfinding)
+        printBatchReport(stats)
+    elif args.replay:
+        replay = Replay.load(args.replay)
+        if args.capture:
+            # Nothing is shown: draw offscreen, as fast as frames can be written
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            initDisplay()
+            name = os.path.splitext(os.path.basename(args.replay))[0]
+            capture = FrameCapture(capturePath(args.capture, name, args.capture_format), args.capture_format)
+            engine = renderReplay(replay, capture)
+            printCaptureSummary(capture.close())
+        else:
+            engine = replay.play()
+        gameOverReason, baseScore, blinkingItemsEaten = engine.result or (
+            'unfinished', engine.baseScore(), engine.blinkingItemsEaten)
+        print('%s: seed %r, %d ticks, %d turns, %s, final score %d' % (
+            args.replay, replay.seed, engine.tick, len(replay.changes), gameOverReason or 'crash',
+            calculateFinalScore(baseScore, blinkingItemsEaten)))
+    else:
+        if args.record:
+            # Fail now rather than lose the replay when the first game ends
+            try:
+                os.makedirs(args.record, exist_ok=True)
+            except OSError as error:
+                parser.error('--record: cannot create %r: %s' % (args.record, error.strerror))
+        REPLAYDIR = args.record or REPLAYDIR
+        REPLAYSNAPSHOTS = args.record_snapshots or REPLAYSNAPSHOTS
+        NUMAIWORMS = args.ai_worms
+        BOARDWIDTH, BOARDHEIGHT = args.board
+        PROFILEPATH = args.profile or PROFILEPATH
+        CAPTUREDIR = args.capture or CAPTUREDIR
+        CAPTUREFORMAT = args.capture_format
+        main()
+
+
+def positiveInt(text):
+    """Parse a count of at least 1 for argparse."""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected a whole number, not %r' % text)
+    if value < 1:
+        raise argparse.ArgumentTypeError('must be at least 1, not %d' % value)
+    return value
+
+
+def boardSize(text):
+    """Parse a WxH board size for argparse."""
+    try:
+        width, height = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected WIDTHxHEIGHT in cells, not %r' % text)
+    if width < MINBOARDSIZE or height < MINBOARDSIZE:
+        raise argparse.ArgumentTypeError('a board needs at least %dx%d cells' % (MINBOARDSIZE, MINBOARDSIZE))
+    return width, height
+
+
+# Added headless batch runner
+BATCHFIELDS = ('gameSeed', 'gameOverReason', 'baseScore', 'blinkingItemsEaten', 'finalScore', 'ticks')
+
+
+def playHeadlessGame(gameSeed, maxTicks=BATCHMAXTICKS, bot='greedy', numAIWorms=NUMAIWORMS,
+                     board=(BOARDWIDTH, BOARDHEIGHT), aiPathfinding=HEADLESSPATHFINDING):
+    """
+    Play one seeded game with one of the BOTS at the controls and return
+    its result as a dict of BATCHFIELDS. Runs in batch worker processes.
+    """
+    engine = WormyEngine(*board, numAIWorms=numAIWorms, seed=gameSeed)
+    engine.aiPathfinding = aiPathfinding
+    chooseDirection = BOTS[bot]
+    result = None
+    while result is None and engine.tick < maxTicks:
+        result = engine.step(chooseDirection(engine))
+    if result is None:
+        result = ('timeout', engine.baseScore(), engine.blinkingItemsEaten)
+    gameOverReason, baseScore, blinkingItemsEaten = result
+    return {'gameSeed': gameSeed,
+            'gameOverReason': gameOverReason or 'crash',
+            'baseScore': baseScore,
+            'blinkingItemsEaten': blinkingItemsEaten,
+            'finalScore': calculateFinalScore(baseScore, blinkingItemsEaten),
+            'ticks': engine.tick}
+
+
+def runBatch(numGames, workers=None, seed=0, maxTicks=BATCHMAXTICKS, csvPath=None, bot='greedy',
+             numAIWorms=NUMAIWORMS, board=(BOARDWIDTH, BOARDHEIGHT), aiPathfinding=HEADLESSPATHFINDING):
+    """
+    Play numGames headless games across a process pool and aggregate them.
+
+    Game i is seeded with the string 'SEED-i', so every game has its own
+    RNG stream and the whole batch is reproducible whatever the number of
+    workers. Results stream back in game order as they finish.
+    """
+    from concurrent.futures import ProcessPoolExecutor # slow to import, and only batches need it
+    workers = workers or os.cpu_count()
+    gameSeeds = ['%s-%s' % (seed, i) for i in range(numGames)]
+    chunksize = max(1, numGames // (workers * 32))
+    reasons = Counter()
+    values = {field: [] for field in BATCHFIELDS[2:]}
+
+    csvFile = open(csvPath, 'w', newline='') if csvPath else None
+    try:
+        writer = csv.DictWriter(csvFile, BATCHFIELDS) if csvFile else None
+        if writer:
+            writer.writeheader()
+        with ProcessPoolExecutor(workers) as executor:
+            maxTicksPerGame = [maxTicks] * numGames
+            bots = [bot] * numGames
+            aiWormCounts = [numAIWorms] * numGames
+            boards = [board] * numGames
+            pathfinding = [aiPathfinding] * numGames
+            for game in executor.map(playHeadlessGame, gameSeeds, maxTicksPerGame, bots, aiWormCounts, boards,
+                                     pathfinding, chunksize=chunksize):
+                reasons[game['gameOverReason']] += 1
+                for field in values:
+                    values[field].append(game[field])
+                if writer:
+                    writer.writerow(game)
+    finally:
+        if csvFile:
+            csvFile.close()
+    return {'games': numGames, 'gameOverReasons': dict(reasons),
+            'distributions': {field: summarize(fieldValues) for field, fieldValues in values.items()}}
+
+
+def summarize(values):
+    """Mean, spread and percentiles of a list of numbers."""
+    ordered = sorted(values)
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))]
+    return {'mean': statistics.fmean(ordered),
+            'stdev': statistics.pstdev(ordered),
+            'min': ordered[0], 'p10': percentile(10), 'p50': percentile(50),
+            'p90': percentile(90), 'p95': percentile(95), 'p99': percentile(99), 'max': ordered[-1]}
+
+
+def printBatchReport(stats):
+    print('%s games' % stats['games'])
+    for reason, count in sorted(stats['gameOverReasons'].items()):
+        print('  %-8s %6d  (%.1f%%)' % (reason, count, 100.0 * count / stats['games']))
+    print('%-20s %9s %8s %6s %6s %6s %6s %6s %6s' % ('', 'mean', 'stdev', 'min', 'p10', 'p50', 'p90', 'p99', 'max'))
+    for field, summary in stats['distributions'].items():
+        print('%-20s %9.2f %8.2f %6d %6d %6d %6d %6d %6d' % (
+            field, summary['mean'], summary['stdev'], summary['min'], summary['p10'],
+            summary['p50'], summary['p90'], summary['p99'], summary['max']))
+
+
+def greedyDirection(engine):
+    """
+    A simple bot: the direction that gets closest to the apple without
+    running into a wall, its own body or a poisonous apple.
+    """
+    head = engine.worm.head()
+    headx, heady = head % engine.cellWidth, head // engine.cellWidth
+    apple = engine.apple or {'x': headx, 'y': heady}
+    poisonCells = {engine.cellIndex(poisonApple) for poisonApple in engine.poisonousApples}
+    bestDirection, bestDistance = engine.direction, None
+    for direction in (UP, DOWN, LEFT, RIGHT):
+        if direction == OPPOSITE[engine.direction]:
+            continue
+        dx, dy = DIRECTIONDELTAS[direction]
+        x, y = headx + dx, heady + dy
+        if not (0 <= x < engine.cellWidth and 0 <= y < engine.cellHeight):
+            continue
+        index = y * engine.cellWidth + x
+        if index in engine.worm or index in poisonCells:
+            continue
+        distance = abs(apple['x'] - x) + abs(apple['y'] - y)
+        if bestDistance is None or distance < bestDistance:
+            bestDirection, bestDistance = direction, distance
+    return bestDirection
+
+
+def autopilotDirection(engine):
+    """The player worm steered by the same distance field as the AI worms."""
+    engine.pathfinder.update()
+    return engine.pathfinder.direction(engine.worm, engine.direction)
+
+
+# Player worm controllers for headless games, by name
+BOTS = {'greedy': greedyDirection, 'autopilot': autopilotDirection}
+
+
 def runGame():
-    # Added game time tracking
-    gameStartTime = pygame.time.get_ticks()  # Track when game started (in milliseconds)
-    gameTime = 0  # Current game time in seconds
-    
-    # Added score tracking for blinking items 
-    blinkingItemsEaten = 0  # Track how many blinking items were eaten (+3 points each)
-    
-    # Added game over reason tracking
-    gameOverReason = None  # 'poison' if lost to poisonous apple, None otherwise
-    
-    # Set a random start point.
-    startx = random.randint(5, CELLWIDTH - 6)
-    starty = random.randint(5, CELLHEIGHT - 6)
-    wormCoords = [{'x': startx,     'y': starty},
-                  {'x': startx - 1, 'y': starty},
-                  {'x': startx - 2, 'y': starty}]
-    direction = RIGHT
-
-    # Added second worm system
-    secondWormCoords = None  # Will be initialized after 20 seconds
-    secondWormDirection = None
-    secondWormSpawned = False
-    
-    # Start the apple in a random place.
-    apple = getRandomLocation()
-    
-    # Added blinking items system
-    # First type: appears every 5 seconds, lasts 5 seconds
-    blinkingItemsType1 = []  # List of active type 1 blinking items
-    lastType1Spawn = 0  # Time when last type 1 item was spawned
-    
-    # Second type: appears only once, lasts 7 seconds
-    blinkingItemType2 = None  # Single type 2 blinking item
-    type2Spawned = False  # Track if type 2 has been spawned
-    
-    # Added poisonous apples system
-    poisonousApples = []  # List of active poisonous apples
-    numPoisonousApples = random.randint(1, 5)  # Random number between 1 and 5
-    poisonSpawnTime = None  # When poisonous apples should spawn (random 10-20 seconds)
-    poisonSpawned = False  # Track if poisonous apples have been spawned
-    poisonActiveTime = None  # When poisonous apples become inactive (5 seconds after spawn)
+    # All game rules live in WormyEngine. This loop runs it on a fixed
+    # timestep of TICKRATE ticks per second, feeding it one buffered
+    # keypress per tick, and draws as often as RENDERFPS allows in between.
+    engine = WormyEngine(BOARDWIDTH, BOARDHEIGHT, numAIWorms=NUMAIWORMS, seed=random.getrandbits(63))
+    recorder = ReplayRecorder(engine, REPLAYDIR and REPLAYSNAPSHOTS)
+    renderer = DirtyRectRenderer(DISPLAYSURF) if DIRTYRECTS else None
+    tickLength = 1000.0 / TICKRATE # milliseconds
+    inputQueue = deque()
+    # A snapshot from before each recent tick. Snapshots grow with the
+    # board, about 9 bytes a cell and as much again for the AI's distance
+    # field, so a big board keeps fewer, and none once that is under a second.
+    rewindTicks = min(REWINDSECONDS * TICKRATE, REWINDMEMORY // (18 * BOARDWIDTH * BOARDHEIGHT))
+    rewindStates = deque(maxlen=rewindTicks if rewindTicks >= TICKRATE else 0)
+    # Phase timings are only taken while F3 shows them or a trace is wanted
+    profiler = engine.profiler = TickProfiler() if PROFILEPATH else None
+    overlay = None
+    capture = None
+    if CAPTUREDIR:
+        name = time.strftime('wormy-%Y%m%d-%H%M%S')
+        capture = FrameCapture(capturePath(CAPTUREDIR, name, CAPTUREFORMAT), CAPTUREFORMAT)
+    lastTime = pygame.time.get_ticks()
+    lag = 0.0 # milliseconds of game time not yet simulated
 
     while True: # main game loop
-        # Update game time 
-        gameTime = (pygame.time.get_ticks() - gameStartTime) / 1000.0  # Convert to seconds
+        ticked = False # whether the board changed and needs a full redraw
+        frameStart = profiler.start() if profiler else None
         for event in pygame.event.get(): # event handling loop
-            if event.type == QUIT:
-                terminate()
-            elif event.type == KEYDOWN:
-                if (event.key == K_LEFT or event.key == K_a) and direction != RIGHT:
-                    direction = LEFT
-                elif (event.key == K_RIGHT or event.key == K_d) and direction != LEFT:
-                    direction = RIGHT
-                elif (event.key == K_UP or event.key == K_w) and direction != DOWN:
-                    direction = UP
-                elif (event.key == K_DOWN or event.key == K_s) and direction != UP:
-                    direction = DOWN
-                elif event.key == K_ESCAPE:
-                    terminate()
+            if event.type == pygame.QUIT:
+                terminate(capture, profiler)
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    terminate(capture, profiler)
+                elif event.key == pygame.K_F3:
+                    if overlay:
+                        if renderer:
+                            renderer.invalidate(overlay.rect)
+                        overlay = None
+                        ticked = True
+                        if not PROFILEPATH:
+                            profiler = engine.profiler = None
+                    else:
+                        overlay = ProfileOverlay()
+                        profiler = engine.profiler = profiler or TickProfiler()
+                elif event.key == pygame.K_BACKSPACE and rewindStates:
+                    # Go back one second, or as far as the ring reaches
+                    for _ in range(min(TICKRATE, len(rewindStates))):
+                        state = rewindStates.pop()
+                    recorder.restore(state)
+                    inputQueue.clear()
+                    lag = 0.0
+                    ticked = True
+                elif event.key in KEYDIRECTIONS:
+                    queueTurn(inputQueue, KEYDIRECTIONS[event.key], engine.direction)
+
+        if profiler:
+            profiler.mark('input')
+
+        now = pygame.time.get_ticks()
+        lag += now - lastTime
+        lastTime = now
+        for _ in range(MAXTICKSPERFRAME):
+            if lag < tickLength:
+                break
+            if rewindStates.maxlen:
+                rewindStates.append(engine.snapshot())
+                if profiler:
+                    profiler.mark('snapshot')
+            result = recorder.step(inputQueue.popleft() if inputQueue else None)
+            if result:
+                if REPLAYDIR:
+                    recorder.replay.save(os.path.join(REPLAYDIR, time.strftime('wormy-%Y%m%d-%H%M%S.wrpl')),
+                                         REPLAYSNAPSHOTS)
+                if PROFILEPATH:
+                    profiler.writeTrace(PROFILEPATH)
+                if capture:
+                    capture.close() # waits for the last few frames to be written
+                return result # game over
+            lag -= tickLength
+            ticked = True
+        else:
+            lag = min(lag, tickLength) # too far behind: drop the backlog
+
+        if renderer:
+            rects = renderer.draw(engine, lag / tickLength)
+        elif ticked:
+            drawGame(engine)
+            rects = [DISPLAYSURF.get_rect()]
+        else:
+            rects = []
+        if overlay:
+            # The overlay sits on the board, so the cells under it are
+            # repainted next frame and it is drawn again on top
+            if renderer and overlay.rect:
+                renderer.invalidate(overlay.rect)
+            rects.append(overlay.draw(profiler))
+        if profiler:
+            profiler.mark('draw')
+        pygame.display.update(rects)
+        if capture and ticked:
+            capture.capture(DISPLAYSURF) # a frame per tick, dropped if the writer is behind
+        if profiler:
+            profiler.mark('display')
+        FPSCLOCK.tick(RENDERFPS)
+        if profiler and frameStart:
+            profiler.mark('wait')
+            profiler.span('frame', frameStart)
+
+
+def queueTurn(turns, direction, current):
+    """
+    Buffer a turn for a later tick, as runGame() and the server's rooms
+    do: at most MAXQUEUEDTURNS, and only real turns, judged against the
+    direction the worm will have when the turn is applied. current is
+    the worm's direction now, or None for any turn at all.
+    """
+    if len(turns) >= MAXQUEUEDTURNS:
+        return
+    if turns:
+        current = turns[-1]
+    if current is None or (direction != current and direction != OPPOSITE[current]):
+        turns.append(direction)
+
+
+# Added free-cell sampler
+class FreeCells:
+    """
+    The set of board cells nothing is standing on.
+
+    use counts the worm segments and items on every cell; a cell is in the
+    cells list exactly while its count is zero, and position maps a cell
+    back to its slot in that list so occupying it is a swap-remove. That
+    makes occupy/release/sample all O(1) however full the board gets.
+
+    Every cell occupied or released is also added to each set in
+    watchers, so a renderer or an AI can follow the board's changes.
+    """
+    __slots__ = ('use', 'cells', 'position', 'watchers')
+
+    def __init__(self, size):
+        self.use = bytearray(size)
+        self.cells = array('i', range(size))
+        self.position = array('i', range(size))
+        self.watchers = []
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, index):
+        return self.use[index] == 0
+
+    def occupy(self, index):
+        if self.use[index] == 0:
+            # move the last free cell into this cell's slot
+            slot = self.position[index]
+            last = self.cells.pop()
+            if last != index:
+                self.cells[slot] = last
+                self.position[last] = slot
+        self.use[index] += 1
+        for changed in self.watchers:
+            changed.add(index)
+
+    def release(self, index):
+        self.use[index] -= 1
+        if self.use[index] == 0:
+            self.position[index] = len(self.cells)
+            self.cells.append(index)
+        for changed in self.watchers:
+            changed.add(index)
+
+    def sample(self, rng):
+        """A uniformly random free cell, or None if the board is full."""
+        if not self.cells:
+            return None
+        return self.cells[rng.randrange(len(self.cells))]
+
+    @classmethod
+    def frombytes(cls, use, position, cells):
+        """A FreeCells copied straight from the raw bytes of its arrays."""
+        board = cls.__new__(cls)
+        board.use = bytearray(use)
+        board.position = array('i')
+        board.position.frombytes(position)
+        board.cells = array('i')
+        board.cells.frombytes(cells)
+        board.watchers = []
+        return board
+
+
+# Added tick scheduler
+class TickScheduler:
+    """
+    Timed game events in a heap keyed on simulation ticks.
+
+    An event is the name of a WormyEngine method plus its arguments, so
+    the queue holds plain data. Events due on the same tick come out in
+    the order their names appear in `order`, then in the order they were
+    scheduled.
+    """
+    __slots__ = ('rank', 'queue', 'count')
+
+    def __init__(self, order=()):
+        self.rank = {event: i for i, event in enumerate(order)}
+        self.queue = []
+        self.count = 0 # tie-breaker keeping same-tick events in order
+
+    def __len__(self):
+        return len(self.queue)
+
+    def schedule(self, tick, event, *args):
+        heapq.heappush(self.queue, (tick, self.rank.get(event, len(self.rank)), self.count, event, args))
+        self.count += 1
+
+    def due(self, tick):
+        """Pop and yield (event, args) for every event due by this tick."""
+        queue = self.queue
+        while queue and queue[0][0] <= tick:
+            _, _, _, event, args = heapq.heappop(queue)
+            yield event, args
+
+
+# Added compact worm body
+class WormBody:
+    """
+    A worm as a ring buffer of packed cell indices (y * cellWidth + x).
+
+    The head is pushed and the tail popped in O(1) without shifting or
+    allocating anything, and the cells set makes "is this cell part of
+    the worm" one lookup. A worm never covers a cell twice: running into
+    itself is fatal.
+
+    Every segment is also registered with the board's FreeCells and with
+    the shared spatial index, a dict from a cell to the list of worms on
+    it, if given.
+    """
+    __slots__ = ('cellWidth', 'cells', 'board', 'shared', 'buffer', 'start', 'length')
+
+    def __init__(self, cellWidth, coords=(), board=None, shared=None):
+        self.cellWidth = cellWidth
+        self.cells = set()
+        self.board = board
+        self.shared = shared
+        self.buffer = array('i', bytes(4 * 16))
+        self.start = 0  # buffer position of the head
+        self.length = 0
+        for x, y in reversed(coords): # coords run from head to tail
+            self.pushHead(y * cellWidth + x)
+
+    def __len__(self):
+        return self.length
+
+    def __contains__(self, index):
+        return index in self.cells
+
+    def __iter__(self):
+        """Cell indices from head to tail."""
+        buffer = self.buffer
+        capacity = len(buffer)
+        end = self.start + self.length
+        if end <= capacity:
+            return iter(buffer[self.start:end])
+        return iter(buffer[self.start:] + buffer[:end - capacity])
+
+    def head(self):
+        return self.buffer[self.start]
+
+    def tail(self):
+        return self.buffer[(self.start + self.length - 1) % len(self.buffer)]
+
+    def coords(self):
+        """(x, y) pairs from head to tail, for drawing."""
+        cellWidth = self.cellWidth
+        return [(index % cellWidth, index // cellWidth) for index in self]
+
+    def pushHead(self, index):
+        if self.length == len(self.buffer):
+            # Full: unroll into a buffer twice the size (amortized O(1))
+            self.buffer = array('i', self) + array('i', bytes(4 * self.length))
+            self.start = 0
+        self.start = (self.start - 1) % len(self.buffer)
+        self.buffer[self.start] = index
+        self.length += 1
+        self.cells.add(index)
+        if self.board is not None:
+            self.board.occupy(index)
+        if self.shared is not None:
+            self.shared.setdefault(index, []).append(self)
+
+    def popTail(self):
+        index = self.tail()
+        self.length -= 1
+        self.cells.remove(index)
+        if self.board is not None:
+            self.board.release(index)
+        if self.shared is not None:
+            worms = self.shared[index]
+            if len(worms) == 1:
+                del self.shared[index]
+            else:
+                worms.remove(self)
+        return index
+
+    def clear(self):
+        """Remove every segment, e.g. when the worm dies."""
+        while self.length:
+            self.popTail()
+
+    def tobytes(self):
+        """The cell indices from head to tail as raw bytes."""
+        end = self.start + self.length
+        if end <= len(self.buffer):
+            return self.buffer[self.start:end].tobytes()
+        return array('i', self).tobytes()
+
+    @classmethod
+    def frombytes(cls, cellWidth, data, board=None, shared=None):
+        """
+        A worm rebuilt from tobytes(). Its segments are added to the shared
+        spatial index but not to the board, which is restored with them.
+        """
+        worm = cls(cellWidth)
+        worm.buffer = array('i')
+        worm.buffer.frombytes(data)
+        worm.length = len(worm.buffer)
+        if worm.length < 16:
+            worm.buffer.frombytes(bytes(4 * (16 - worm.length)))
+        worm.cells = set(worm.buffer[:worm.length])
+        if shared is not None:
+            for index in worm.cells:
+                shared.setdefault(index, []).append(worm)
+        worm.board = board
+        worm.shared = shared
+        return worm
+
+
+class AIWorm(WormBody):
+    """
+    A computer controlled worm: its body plus where it is heading and its
+    palette colors. A steered one plays by the same rules but keeps the
+    direction it is given, e.g. by a remote player, instead of choosing.
+    """
+    __slots__ = ('direction', 'palette', 'steered')
+
+    def __init__(self, cellWidth, coords=(), board=None, shared=None, direction=RIGHT, palette=0):
+        super().__init__(cellWidth, coords, board, shared)
+        self.direction = direction
+        self.palette = palette # index into AIWORMPALETTE
+        self.steered = False
+
+
+# Added headless simulation engine
+class WormyEngine:
+    """
+    The Wormy game rules without any pygame display, input or clock.
+
+    Time is counted in logical ticks: one call to step() is one frame of
+    runGame() and gameTime is tick / tickRate seconds, so a bot or a
+    regression run can play a whole game as fast as the CPU allows.
+    """
+
+    def __init__(self, cellWidth=CELLWIDTH, cellHeight=CELLHEIGHT, tickRate=TICKRATE, numAIWorms=NUMAIWORMS,
+                 seed=None):
+        self.cellWidth = cellWidth
+        self.cellHeight = cellHeight
+        self.tickRate = tickRate
+        self.numAIWorms = numAIWorms
+        self.aiPathfinding = AIPATHFINDING
+        self.pathfinder = DistanceField(self)
+        self.profiler = None # a TickProfiler to time each phase of step() with
+        self.reset(seed) # costly on a big board, so done once here rather than again by the caller
+
+    def reset(self, seed=None):
+        """Start a new game. The same seed always plays out the same game."""
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.rngState = None # (packed RNGWORDS, gauss) known to match rng, or None once it may have moved
+        self.rngPending = False # rng still has to be set to rngState, after a restore()
+        self.tick = 0
+        self.gameTime = 0.0
+        self.blinkingItemsEaten = 0
+        self.gameOverReason = None
+        self.result = None # (gameOverReason, baseScore, blinkingItemsEaten) once over
+
+        # Every worm segment and item occupies its cell on the board, so
+        # spawns can be drawn straight from the cells that are still free.
+        self.board = FreeCells(self.cellWidth * self.cellHeight)
+        # Every worm segment is also filed under its cell in this spatial
+        # index, so worms touching each other are found in one lookup.
+        self.wormIndex = {}
+
+        # Set a random start point.
+        startx = self.random.randint(5, self.cellWidth - 6)
+        starty = self.random.randint(5, self.cellHeight - 6)
+        self.worm = WormBody(self.cellWidth,
+                             [(startx, starty), (startx - 1, starty), (startx - 2, starty)],
+                             self.board, self.wormIndex)
+        self.direction = RIGHT
+
+        # AI worms, spawned after 20 seconds
+        self.aiWorms = []
+
+        # Start the apple in a random place.
+        self.apple = self.getRandomLocation()
+
+        # Type 1 blinking items appear every 5 seconds and last 5 seconds;
+        # the single type 2 item appears after 2 seconds and lasts 7.
+        self.blinkingItemsType1 = []
+        self.blinkingItemType2 = None
+
+        # Poisonous apples appear 10-20 seconds in and are replaced by a
+        # fresh set every 5 seconds from then on.
+        self.poisonousApples = []
+        self.numPoisonousApples = self.random.randint(1, 5)
+        self.poisonSpawnTime = self.random.randint(10, 20)
+
+        # Every spawn and expiry is an event on the tick clock
+        self.scheduler = TickScheduler(EVENTORDER)
+        for number in range(self.numAIWorms):
+            self.scheduler.schedule(self.ticks(20), 'spawnAIWorm', number)
+        self.scheduler.schedule(self.ticks(5.0), 'spawnType1')
+        self.scheduler.schedule(self.ticks(2.0), 'spawnType2')
+        self.scheduler.schedule(self.ticks(self.poisonSpawnTime), 'spawnPoison')
+
+    @property
+    def random(self):
+        """
+        The game's random.Random. Copying its 625 words of state is the
+        costliest part of snapshot() and restore(), and most ticks never
+        draw a random number, so restore() only sets the RNG when it is
+        next used, and snapshot() reuses the packed words until then.
+        """
+        if self.rngPending:
+            words, gauss = self.rngState
+            self.rng.setstate((3, RNGWORDS.unpack(words), gauss))
+            self.rngPending = False
+        self.rngState = None # about to be drawn from
+        return self.rng
+
+    @property
+    def wormsOnCell(self):
+        """
+        The spatial index, a dict from a cell to the worms on it. After a
+        restore() it is rebuilt from the worm bodies on first use.
+        """
+        if self.wormIndex is None:
+            self.wormIndex = wormIndex = {}
+            for worm in [self.worm] + self.aiWorms:
+                worm.shared = wormIndex
+                for index in worm.cells:
+                    wormIndex.setdefault(index, []).append(worm)
+        return self.wormIndex
+
+    def ticks(self, seconds):
+        """The first tick at least this many seconds into the game."""
+        return math.ceil(seconds * self.tickRate)
+
+    def cellIndex(self, coord):
+        return coord['y'] * self.cellWidth + coord['x']
+
+    def cellCoord(self, index):
+        return {'x': index % self.cellWidth, 'y': index // self.cellWidth}
+
+    def getRandomLocation(self):
+        """
+        Claim a random empty cell for a new item and return it, or None if
+        the board is full. Hand it back with releaseLocation() when the
+        item is eaten or expires.
+        """
+        index = self.board.sample(self.random)
+        if index is None:
+            return None
+        self.board.occupy(index)
+        return self.cellCoord(index)
+
+    def releaseLocation(self, item):
+        self.board.release(self.cellIndex(item))
+
+    def baseScore(self):
+        return len(self.worm) - 3
+
+    def finalScore(self):
+        return calculateFinalScore(self.baseScore(), self.blinkingItemsEaten)
+
+    def snapshot(self, withField=True):
+        """
+        The whole game state, RNG included, as one compact bytes object:
+        a SNAPSHOTHEADER of the scalars and array lengths, the RNG words,
+        then the board and worm arrays copied as raw memory, with the AI
+        worms as (length, direction, palette) triples followed by their
+        bodies, and last the distance field's progress. restore() puts it
+        back exactly, so the game continues as if never stopped.
+
+        Without the field, about half the bytes on a small board, a
+        snapshot suits a lookahead clone: the field is derived from the
+        board and rebuilt on its next update() after the restore. Only
+        where a sweep outlasts a tick can the AI then steer differently,
+        so rewinds and replays keep it.
+        """
+        if self.rngState is None:
+            internalState, gauss = self.rng.getstate()[1:]
+            self.rngState = (RNGWORDS.pack(*internalState), gauss)
+        words, gauss = self.rngState
+        result = self.result or (None, 0, 0)
+        type2 = self.blinkingItemType2
+        board = self.board
+        aiWorms = array('i')
+        for aiWorm in self.aiWorms:
+            aiWorms.extend((len(aiWorm), DIRECTIONCODES.index(aiWorm.direction), aiWorm.palette))
+        events = array('i')
+        for tick, _, count, event, args in self.scheduler.queue:
+            events.extend((tick, count, EVENTORDER.index(event), args[0] if args else -1))
+        items = array('i')
+        for item in self.blinkingItemsType1:
+            items.extend((self.cellIndex(item), item['spawnTick']))
+        items.extend(self.cellIndex(poisonApple) for poisonApple in self.poisonousApples)
+        field = self.pathfinder.tobytes() if withField else b''
+
+        header = SNAPSHOTHEADER.pack(
+            self.cellWidth, self.cellHeight, self.tick, self.gameTime, self.blinkingItemsEaten,
+            DIRECTIONCODES.index(self.direction), GAMEOVERCODES.index(self.gameOverReason), self.result is not None,
+            GAMEOVERCODES.index(result[0]), self.numPoisonousApples, self.poisonSpawnTime,
+            result[1], result[2], self.cellIndex(self.apple) if self.apple else -1,
+            self.cellIndex(type2) if type2 else -1, type2['spawnTick'] if type2 else -1,
+            self.scheduler.count, gauss is not None, gauss or 0.0,
+            len(self.worm), len(self.aiWorms),
+            len(self.blinkingItemsType1), len(self.poisonousApples), len(self.scheduler), len(board), len(field))
+        return b''.join((header, words, board.use, board.position,
+                         board.cells, self.worm.tobytes(), items, events, aiWorms,
+                         *[aiWorm.tobytes() for aiWorm in self.aiWorms], field))
+
+    def restore(self, state):
+        """Return the game to a state taken with snapshot()."""
+        state = memoryview(state)
+        (cellWidth, cellHeight, self.tick, self.gameTime, self.blinkingItemsEaten,
+         direction, gameOverReason, hasResult, resultReason,
+         self.numPoisonousApples, self.poisonSpawnTime, resultBase, resultBlink, apple,
+         type2, type2SpawnTick, schedulerCount, hasGauss, gauss, wormLength, numAIWorms,
+         numType1, numPoison, numEvents, numFree, fieldSize) = SNAPSHOTHEADER.unpack_from(state)
+        if (cellWidth, cellHeight) != (self.cellWidth, self.cellHeight):
+            raise ValueError('snapshot of a %dx%d board' % (cellWidth, cellHeight))
+        position = SNAPSHOTHEADER.size
+        self.rngState = (bytes(state[position:position + RNGWORDS.size]), gauss if hasGauss else None)
+        self.rngPending = True
+        position += RNGWORDS.size
+
+        # Every array in the order snapshot() wrote it, as (start, end)
+        numCells = cellWidth * cellHeight
+        sizes = (numCells, 4 * numCells, 4 * numFree, 4 * wormLength,
+                 4 * (2 * numType1 + numPoison), 4 * 4 * numEvents, 4 * 3 * numAIWorms)
+        spans = []
+        for size in sizes:
+            spans.append((position, position + size))
+            position += size
+        use, positions, free, worm, items, events, aiWorms = [state[start:end] for start, end in spans]
+
+        self.board = FreeCells.frombytes(use, positions, free)
+        self.wormIndex = None # rebuilt when next needed
+        self.worm = WormBody.frombytes(cellWidth, worm, self.board)
+        self.direction = DIRECTIONCODES[direction]
+        self.aiWorms = []
+        aiWorms = aiWorms.cast('i')
+        for i in range(0, 3 * numAIWorms, 3):
+            length, aiDirection, palette = aiWorms[i:i + 3]
+            aiWorm = AIWorm.frombytes(cellWidth, state[position:position + 4 * length], self.board)
+            aiWorm.direction = DIRECTIONCODES[aiDirection]
+            aiWorm.palette = palette
+            self.aiWorms.append(aiWorm)
+            position += 4 * length
+        self.pathfinder.restore(state[position:position + fieldSize])
+        self.gameOverReason = GAMEOVERCODES[gameOverReason]
+        self.result = (GAMEOVERCODES[resultReason], resultBase, resultBlink) if hasResult else None
+
+        self.apple = self.cellCoord(apple) if apple >= 0 else None
+        if type2 >= 0:
+            self.blinkingItemType2 = self.cellCoord(type2)
+            self.blinkingItemType2.update(spawnTick=type2SpawnTick, type=2)
+        else:
+            self.blinkingItemType2 = None
+        items = items.cast('i')
+        self.blinkingItemsType1 = []
+        for i in range(0, 2 * numType1, 2):
+            item = self.cellCoord(items[i])
+            item.update(spawnTick=items[i + 1], type=1)
+            self.blinkingItemsType1.append(item)
+        self.poisonousApples = [self.cellCoord(index) for index in items[2 * numType1:]]
+
+        scheduler = TickScheduler(EVENTORDER)
+        events = events.cast('i')
+        for i in range(0, 4 * numEvents, 4):
+            tick, count, event, arg = events[i:i + 4]
+            scheduler.queue.append((tick, event, count, EVENTORDER[event], (arg,) if arg >= 0 else ()))
+        scheduler.count = schedulerCount
+        self.scheduler = scheduler
+
+    def step(self, action=None):
+        """
+        Advance the game by one tick.
+
+        action is UP, DOWN, LEFT, RIGHT or None to keep going straight; a
+        reversal is ignored just like the keyboard handling in runGame().
+        Returns None while the game is running, and the runGame() style
+        (gameOverReason, baseScore, blinkingItemsEaten) tuple when it ends.
+        """
+        if self.result:
+            return self.result
+        if action in OPPOSITE and OPPOSITE[action] != self.direction:
+            self.direction = action
+
+        profiler = self.profiler
+        if profiler:
+            tickStart = profiler.start()
+        self.gameTime = self.tick / self.tickRate
+        for event, args in self.scheduler.due(self.tick):
+            getattr(self, event)(*args)
+            if profiler:
+                profiler.mark(event)
+
+        result = self.moveWorm()
+        if profiler:
+            profiler.mark('moveWorm')
+        if not result and self.aiWorms:
+            self.moveAIWorms()
+        self.tick += 1
+        if result:
+            self.result = result
+        if profiler:
+            profiler.span('tick', tickStart)
+        return result
+
+    def retry(self, event, *args):
+        """Try a spawn that had no room again on the next tick."""
+        self.scheduler.schedule(self.tick + 1, event, *args)
+
+    def spawnAIWorm(self, number):
+        # Spawn AI worm number on free cells away from the edges. Only a few
+        # free cells are tried per tick; if none fits, try again next tick.
+        if self.placeAIWorm(number) is None:
+            self.retry('spawnAIWorm', number)
+
+    def placeAIWorm(self, number):
+        """Try SPAWNATTEMPTS free cells for AI worm number and return the worm, or None if none fit."""
+        for _ in range(SPAWNATTEMPTS):
+            index = self.board.sample(self.random)
+            if index is None:
+                break
+            aiStartx, aiStarty = index % self.cellWidth, index // self.cellWidth
+            if (5 <= aiStartx <= self.cellWidth - 6 and 5 <= aiStarty <= self.cellHeight - 6
+                    and index - 1 in self.board and index - 2 in self.board):
+                aiWorm = AIWorm(self.cellWidth,
+                                [(aiStartx, aiStarty), (aiStartx - 1, aiStarty), (aiStartx - 2, aiStarty)],
+                                self.board, self.wormsOnCell, palette=number % len(AIWORMPALETTE))
+                # Random initial direction for the AI worm
+                aiWorm.direction = self.random.choice([UP, DOWN, LEFT, RIGHT])
+                self.aiWorms.append(aiWorm)
+                return aiWorm
+        return None
+
+    def spawnApple(self):
+        self.apple = self.getRandomLocation()
+        if self.apple is None:
+            self.retry('spawnApple') # the board is full
+
+    def eatApple(self):
+        """The apple was eaten: set a new apple somewhere."""
+        self.releaseLocation(self.apple)
+        self.spawnApple()
+
+    def blinkingItemRoom(self):
+        """True if there are less than 3 blinking items on the board."""
+        return len(self.blinkingItemsType1) + (1 if self.blinkingItemType2 else 0) < 3
+
+    def spawnType1(self):
+        newItem = self.getRandomLocation() if self.blinkingItemRoom() else None
+        if newItem is None:
+            self.retry('spawnType1')
+            return
+        newItem['spawnTick'] = self.tick
+        newItem['type'] = 1
+        self.blinkingItemsType1.append(newItem)
+        self.scheduler.schedule(self.tick + self.ticks(5.0), 'expireType1', self.tick)
+        self.scheduler.schedule(self.tick + self.ticks(5.0), 'spawnType1')
+
+    def expireType1(self, spawnTick):
+        for i, item in enumerate(self.blinkingItemsType1):
+            if item['spawnTick'] == spawnTick: # still there, not eaten
+                self.releaseLocation(self.blinkingItemsType1.pop(i))
+                break
+
+    def spawnType2(self):
+        newItem = self.getRandomLocation() if self.blinkingItemRoom() else None
+        if newItem is None:
+            self.retry('spawnType2')
+            return
+        newItem['spawnTick'] = self.tick
+        newItem['type'] = 2
+        self.blinkingItemType2 = newItem
+        self.scheduler.schedule(self.tick + self.ticks(7.0), 'expireType2')
+
+    def expireType2(self):
+        if self.blinkingItemType2:
+            self.releaseLocation(self.blinkingItemType2)
+            self.blinkingItemType2 = None
+
+    def spawnPoison(self):
+        for _ in range(self.numPoisonousApples):
+            poisonPos = self.getRandomLocation()
+            if poisonPos:
+                self.poisonousApples.append(poisonPos)
+        self.scheduler.schedule(self.tick + self.ticks(5.0), 'expirePoison') # Active for 5 seconds
+
+    def expirePoison(self):
+        for poisonApple in self.poisonousApples:
+            self.releaseLocation(poisonApple)
+        self.poisonousApples = []
+        self.retry('spawnPoison') # the next set appears on the following tick
+
+    def moveWorm(self):
+        """Move the player worm; returns the game over tuple if it died."""
+        worm = self.worm
 
-        # Spawn second worm after 20 seconds
-        if gameTime >= 20 and not secondWormSpawned:
-            # Spawn second worm at a random location (not overlapping with first worm)
-            while True:
-                secondStartx = random.randint(5, CELLWIDTH - 6)
-                secondStarty = random.randint(5, CELLHEIGHT - 6)
-                # Check if position overlaps with first worm
-                overlap = False
-                for coord in wormCoords:
-                    if coord['x'] == secondStartx and coord['y'] == secondStarty:
-                        overlap = True
-                        break
-                if not overlap:
-                    break
-            
-            secondWormCoords = [{'x': secondStartx,     'y': secondStarty},
-                               {'x': secondStartx - 1, 'y': secondStarty},
-                               {'x': secondStartx - 2, 'y': secondStarty}]
-            # Random initial direction for second worm
-            secondWormDirection = random.choice([UP, DOWN, LEFT, RIGHT])
-            secondWormSpawned = True
-        
-        # Spawn blinking items
-        # Type 1: Spawn every 5 seconds each lasts 5 seconds
-        if gameTime - lastType1Spawn >= 5.0:
-            # Remove expired type 1 items (older than 5 seconds)
-            currentTime = pygame.time.get_ticks()
-            blinkingItemsType1 = [item for item in blinkingItemsType1 
-                                 if (currentTime - item['spawnTime']) / 1000.0 < 5.0]
-            
-            # Spawn new type 1 item if we have less than 3 total blinking items
-            totalBlinkingItems = len(blinkingItemsType1) + (1 if blinkingItemType2 else 0)
-            if totalBlinkingItems < 3:
-                newItem = getRandomLocation()
-                newItem['spawnTime'] = pygame.time.get_ticks()
-                newItem['type'] = 1
-                blinkingItemsType1.append(newItem)
-                lastType1Spawn = gameTime
-        
-        # Type 2: Spawn only once lasts 7 seconds
-        if not type2Spawned and gameTime >= 2.0:  # Spawn after 2 seconds to ensure it appears
-            totalBlinkingItems = len(blinkingItemsType1) + (1 if blinkingItemType2 else 0)
-            if totalBlinkingItems < 3:
-                blinkingItemType2 = getRandomLocation()
-                blinkingItemType2['spawnTime'] = pygame.time.get_ticks()
-                blinkingItemType2['type'] = 2
-                type2Spawned = True
-        
-        # Remove expired type 2 item (after 7 seconds)
-        if blinkingItemType2:
-            if (pygame.time.get_ticks() - blinkingItemType2['spawnTime']) / 1000.0 >= 7.0:
-                blinkingItemType2 = None
-        
-        # Spawn poisonous apples
-        if not poisonSpawned:
-            # Random time between 10 and 20 seconds
-            poisonSpawnTime = random.randint(10, 20)
-            poisonSpawned = True
-        
-        if gameTime >= poisonSpawnTime and len(poisonousApples) == 0 and poisonActiveTime is None:
-            # Spawn poisonous apples
-            for _ in range(numPoisonousApples):
-                while True:
-                    poisonPos = getRandomLocation()
-                    # Check if position overlaps with first worm
-                    overlap = False
-                    for coord in wormCoords:
-                        if coord['x'] == poisonPos['x'] and coord['y'] == poisonPos['y']:
-                            overlap = True
-                            break
-                    # Check if position overlaps with second worm
-                    if secondWormCoords:
-                        for coord in secondWormCoords:
-                            if coord['x'] == poisonPos['x'] and coord['y'] == poisonPos['y']:
-                                overlap = True
-                                break
-                    if not overlap:
-                        poisonousApples.append(poisonPos)
-                        break
-            
-            poisonActiveTime = gameTime + 5.0  # Active for 5 seconds
-        
-        # Remove poisonous apples after 5 seconds
-        if poisonActiveTime and gameTime >= poisonActiveTime:
-            poisonousApples = []
-            poisonActiveTime = None
-        
         # move the worm by adding a segment in the direction it is moving
-        if direction == UP:
-            newHead = {'x': wormCoords[HEAD]['x'], 'y': wormCoords[HEAD]['y'] - 1}
-        elif direction == DOWN:
-            newHead = {'x': wormCoords[HEAD]['x'], 'y': wormCoords[HEAD]['y'] + 1}
-        elif direction == LEFT:
-            newHead = {'x': wormCoords[HEAD]['x'] - 1, 'y': wormCoords[HEAD]['y']}
-        elif direction == RIGHT:
-            newHead = {'x': wormCoords[HEAD]['x'] + 1, 'y': wormCoords[HEAD]['y']}
-        wormCoords.insert(0, newHead)
-        
-        # check if the worm has hit itself or the edge
-        if wormCoords[HEAD]['x'] == -1 or wormCoords[HEAD]['x'] == CELLWIDTH or wormCoords[HEAD]['y'] == -1 or wormCoords[HEAD]['y'] == CELLHEIGHT:
-            # Pass game over reason and score
-            return (gameOverReason, len(wormCoords) - 3, blinkingItemsEaten) # game over
-        for wormBody in wormCoords[1:]:
-            if wormBody['x'] == wormCoords[HEAD]['x'] and wormBody['y'] == wormCoords[HEAD]['y']:
-                # Pass game over reason and score
-                return (gameOverReason, len(wormCoords) - 3, blinkingItemsEaten) # game over
+        dx, dy = DIRECTIONDELTAS[self.direction]
+        heady, headx = divmod(worm.head(), self.cellWidth)
+        headx += dx
+        heady += dy
+
+        # check if the worm has hit the edge or itself (its old tail is still
+        # in the body, so running into it is fatal like before). The score
+        # counts the new head, as it always has.
+        if headx == -1 or headx == self.cellWidth or heady == -1 or heady == self.cellHeight:
+            return (self.gameOverReason, len(worm) + 1 - 3, self.blinkingItemsEaten)
+        headIndex = heady * self.cellWidth + headx
+        if headIndex in worm:
+            return (self.gameOverReason, len(worm) + 1 - 3, self.blinkingItemsEaten)
+        worm.pushHead(headIndex)
 
         # Check if worm has eaten a poisonous apple
         poisonEaten = False
-        for i, poisonApple in enumerate(poisonousApples):
-            if wormCoords[HEAD]['x'] == poisonApple['x'] and wormCoords[HEAD]['y'] == poisonApple['y']:
+        for i, poisonApple in enumerate(self.poisonousApples):
+            if headx == poisonApple['x'] and heady == poisonApple['y']:
                 # Reduce worm length by 2 segments
                 for _ in range(2):
-                    if len(wormCoords) > 3:  # Keep minimum length of 3
-                        del wormCoords[-1]
+                    if len(worm) > 3: # Keep minimum length of 3
+                        worm.popTail()
                     else:
                         # Worm has no segments left, game over
-                        gameOverReason = 'poison'
-                        # Pass game over reason and score 
-                        return (gameOverReason, len(wormCoords) - 3, blinkingItemsEaten)
-                poisonousApples.pop(i)  # Remove eaten poisonous apple
+                        self.gameOverReason = 'poison'
+                        return (self.gameOverReason, len(worm) - 3, self.blinkingItemsEaten)
+                self.releaseLocation(self.poisonousApples.pop(i))
                 poisonEaten = True
                 break
-        
-        # Check if worm has eaten blinking items
+
         # Check type 1 blinking items
-        for i, item in enumerate(blinkingItemsType1):
-            if wormCoords[HEAD]['x'] == item['x'] and wormCoords[HEAD]['y'] == item['y']:
-                blinkingItemsEaten += 1
-                blinkingItemsType1.pop(i)
+        for i, item in enumerate(self.blinkingItemsType1):
+            if headx == item['x'] and heady == item['y']:
+                self.blinkingItemsEaten += 1
+                self.releaseLocation(self.blinkingItemsType1.pop(i))
                 break
-        
+
         # Check type 2 blinking item
-        if blinkingItemType2:
-            if wormCoords[HEAD]['x'] == blinkingItemType2['x'] and wormCoords[HEAD]['y'] == blinkingItemType2['y']:
-                blinkingItemsEaten += 1
-                blinkingItemType2 = None
-        
-        # Check collision with second worm (after movement
-        originalWormGrows = False
-        if secondWormCoords:
-            # Check if original worm's head touches second worm's body
-            for segment in secondWormCoords:
-                if wormCoords[HEAD]['x'] == segment['x'] and wormCoords[HEAD]['y'] == segment['y']:
-                    # Original worm grows by one segment
-                    originalWormGrows = True
-                    break
-        
+        if self.blinkingItemType2:
+            if headx == self.blinkingItemType2['x'] and heady == self.blinkingItemType2['y']:
+                self.blinkingItemsEaten += 1
+                self.releaseLocation(self.blinkingItemType2)
+                self.blinkingItemType2 = None
+
+        # Original worm grows when its head touches an AI worm's body
+        originalWormGrows = len(self.wormsOnCell[headIndex]) > 1
+
         # check if worm has eaten an apple
         appleEaten = False
-        if wormCoords[HEAD]['x'] == apple['x'] and wormCoords[HEAD]['y'] == apple['y']:
+        if self.apple and headx == self.apple['x'] and heady == self.apple['y']:
             # don't remove worm's tail segment
-            apple = getRandomLocation() # set a new apple somewhere
+            self.eatApple()
             appleEaten = True
-        
+
         # Remove tail only if not eating apple, not eating poison, and not colliding with second worm
         if not appleEaten and not poisonEaten and not originalWormGrows:
-            del wormCoords[-1] # remove worm's tail segment
-        
-        # Move second worm with random AI 
-        if secondWormCoords:
-            # Randomly change direction occasionally (30% chance each frame)
-            if random.random() < 0.3:
-                # Choose a random direction that's not opposite to current
-                possibleDirections = [UP, DOWN, LEFT, RIGHT]
-                if secondWormDirection == UP:
-                    possibleDirections.remove(DOWN)
-                elif secondWormDirection == DOWN:
-                    possibleDirections.remove(UP)
-                elif secondWormDirection == LEFT:
-                    possibleDirections.remove(RIGHT)
-                elif secondWormDirection == RIGHT:
-                    possibleDirections.remove(LEFT)
-                secondWormDirection = random.choice(possibleDirections)
-            
-            # Move second worm
-            if secondWormDirection == UP:
-                newSecondHead = {'x': secondWormCoords[HEAD]['x'], 'y': secondWormCoords[HEAD]['y'] - 1}
-            elif secondWormDirection == DOWN:
-                newSecondHead = {'x': secondWormCoords[HEAD]['x'], 'y': secondWormCoords[HEAD]['y'] + 1}
-            elif secondWormDirection == LEFT:
-                newSecondHead = {'x': secondWormCoords[HEAD]['x'] - 1, 'y': secondWormCoords[HEAD]['y']}
-            elif secondWormDirection == RIGHT:
-                newSecondHead = {'x': secondWormCoords[HEAD]['x'] + 1, 'y': secondWormCoords[HEAD]['y']}
-            
-            secondWormCoords.insert(0, newSecondHead)
-            
-            # Check if second worm hits edge or itself
-            if (secondWormCoords[HEAD]['x'] == -1 or secondWormCoords[HEAD]['x'] == CELLWIDTH or 
-                secondWormCoords[HEAD]['y'] == -1 or secondWormCoords[HEAD]['y'] == CELLHEIGHT):
-                # Second worm dies, remove it
-                secondWormCoords = None
+            worm.popTail() # remove worm's tail segment
+        return None
+
+    def moveAIWorms(self):
+        """Move every AI worm in the order they spawned."""
+        profiler = self.profiler
+        if self.aiPathfinding and not all(aiWorm.steered for aiWorm in self.aiWorms):
+            self.pathfinder.update()
+            if profiler:
+                profiler.mark('pathfinder')
+        for aiWorm in list(self.aiWorms):
+            self.moveAIWorm(aiWorm)
+        if profiler:
+            profiler.mark('moveAIWorms')
+
+    def moveAIWorm(self, aiWorm):
+        if aiWorm.steered:
+            pass # its player has set the direction already
+        elif self.aiPathfinding:
+            aiWorm.direction = self.pathfinder.direction(aiWorm, aiWorm.direction)
+        # Randomly change direction occasionally (30% chance each frame)
+        elif self.random.random() < 0.3:
+            # Choose a random direction that's not opposite to current
+            possibleDirections = [UP, DOWN, LEFT, RIGHT]
+            possibleDirections.remove(OPPOSITE[aiWorm.direction])
+            aiWorm.direction = self.random.choice(possibleDirections)
+
+        dx, dy = DIRECTIONDELTAS[aiWorm.direction]
+        heady, headx = divmod(aiWorm.head(), self.cellWidth)
+        headx += dx
+        heady += dy
+
+        # An AI worm dies (is removed) if it hits the edge or itself
+        if headx == -1 or headx == self.cellWidth or heady == -1 or heady == self.cellHeight:
+            aiWorm.clear()
+            self.aiWorms.remove(aiWorm)
+            return
+        headIndex = heady * self.cellWidth + headx
+        if headIndex in aiWorm:
+            aiWorm.clear()
+            self.aiWorms.remove(aiWorm)
+            return
+        aiWorm.pushHead(headIndex)
+
+        # An AI worm grows when its head touches another worm's body
+        aiWormGrows = len(self.wormsOnCell[headIndex]) > 1
+
+        # Check if the AI worm would eat apple
+        appleEatenByAI = False
+        if self.apple and headx == self.apple['x'] and heady == self.apple['y']:
+            self.eatApple()
+            appleEatenByAI = True
+
+        # Remove tail only if not eating apple and not colliding with another worm
+        if not appleEatenByAI and not aiWormGrows:
+            if len(aiWorm) > 3: # Keep minimum length
+                aiWorm.popTail()
+
+
+# Added pathfinding AI
+class DistanceField:
+    """
+    Shortest path distances from every cell to the apple, going round
+    all the worms and the poisonous apples, for steering worms at the apple.
+
+    A new apple starts a breadth-first sweep; after that the field is
+    kept up to date incrementally (Lifelong Planning A* without a
+    heuristic): each cell has its distance g and rhs, the distance its
+    neighbours say it should have, and only cells where the two disagree
+    are queued and settled. A worm moving frees one cell and blocks
+    another, so most ticks only touch a handful of cells. At most budget
+    cells are swept or settled per update and the rest carries over to
+    the next one, so a big board never holds up a frame. Until the search
+    reaches a cell its distance reads as unreachable and direction()
+    falls back on moving safely.
+
+    The arrays cover the board plus a border of blocked cells, so the
+    four neighbours of a cell are always just index -1, +1, -stride and
+    +stride.
+
+    On a big board the field read on a tick depends on how much of the
+    work the earlier updates got through, not only on the game state, so
+    WormyEngine.snapshot() saves that progress with tobytes() and
+    restore() picks it up again: replays, seeks and rewinds play out the
+    same on any board.
+    """
+    INF = 1 << 30
+
+    def __init__(self, engine, budget=AIBUDGET):
+        self.engine = engine
+        self.budget = budget
+        self.stride = engine.cellWidth + 2
+        self.board = None
+        self.changed = set() # cells the board reported touched since the last update
+
+    def cell(self, index):
+        """The field index of a board cell index."""
+        return index + (index // self.engine.cellWidth) * 2 + self.stride + 1
+
+    def reset(self):
+        """Start over on a new board: block the border, every body and poison cell, search afresh."""
+        engine = self.engine
+        self.board = engine.board
+        self.changed = set()
+        self.board.watchers.append(self.changed)
+        stride = self.stride
+        self.blocked = bytearray(b'\x01') * (stride * (engine.cellHeight + 2))
+        for y in range(engine.cellHeight):
+            start = (y + 1) * stride + 1
+            self.blocked[start:start + engine.cellWidth] = bytes(engine.cellWidth)
+        for index in self.obstacles():
+            self.blocked[self.cell(index)] = 1
+        self.retarget(self.cell(engine.cellIndex(engine.apple)) if engine.apple else None)
+
+    def obstacles(self):
+        engine = self.engine
+        yield from engine.worm
+        for aiWorm in engine.aiWorms:
+            yield from aiWorm
+        for poisonApple in engine.poisonousApples:
+            yield engine.cellIndex(poisonApple)
+
+    def retarget(self, target):
+        """Clear the field and start a breadth-first sweep out from a new apple."""
+        self.target = target
+        self.g = array('i', [self.INF]) * len(self.blocked)
+        self.rhs = array('i', [self.INF]) * len(self.blocked)
+        self.queue = []
+        self.sweep = deque()
+        self.pending = set() # cells blocked or freed while the sweep was running
+        if target is not None:
+            self.g[target] = self.rhs[target] = 0
+            self.sweep.append(target)
+
+    def updateCell(self, index):
+        """Recompute a cell's rhs from its neighbours and queue it if it disagrees with g."""
+        g, rhs, stride = self.g, self.rhs, self.stride
+        if index != self.target:
+            if self.blocked[index]:
+                rhs[index] = self.INF
             else:
-                for wormBody in secondWormCoords[1:]:
-                    if wormBody['x'] == secondWormCoords[HEAD]['x'] and wormBody['y'] == secondWormCoords[HEAD]['y']:
-                        # Second worm dies, remove it
-                        secondWormCoords = None
-                        break
-                
-                if secondWormCoords:
-                    # Check if second worm's head touches original worm's body (makes second worm grow)
-                    secondWormGrows = False
-                    for segment in wormCoords:
-                        if secondWormCoords[HEAD]['x'] == segment['x'] and secondWormCoords[HEAD]['y'] == segment['y']:
-                            # Second worm grows by one segment
-                            secondWormGrows = True
-                            break
-                    
-                    # Check if second worm would eat apple
-                    appleEatenBySecond = False
-                    if secondWormCoords[HEAD]['x'] == apple['x'] and secondWormCoords[HEAD]['y'] == apple['y']:
-                        # Don't remove tail
-                        apple = getRandomLocation()
-                        appleEatenBySecond = True
-                    
-                    # Remove tail only if not eating apple and not colliding with original worm
-                    if not appleEatenBySecond and not secondWormGrows:
-                        if len(secondWormCoords) > 3:  # Keep minimum length
-                            del secondWormCoords[-1]
-        
-        DISPLAYSURF.fill(BGCOLOR)
-        drawGrid()
-        drawWorm(wormCoords)
-        # Draw second worm
-        if secondWormCoords:
-            drawSecondWorm(secondWormCoords)
-        drawApple(apple)
-        # Draw blinking items 
-        drawBlinkingItems(blinkingItemsType1, blinkingItemType2, gameTime)
-        # Draw poisonous apples
-        drawPoisonousApples(poisonousApples)
-        # Calculate and draw score with formula
-        baseScore = len(wormCoords) - 3
-        finalScore = calculateFinalScore(baseScore, blinkingItemsEaten)
-        drawScore(finalScore)
-        pygame.display.update()
-        FPSCLOCK.tick(FPS)
+                best = min(g[index - 1], g[index + 1], g[index - stride], g[index + stride])
+                rhs[index] = best + 1 if best < self.INF else self.INF
+        if g[index] != rhs[index]:
+            heapq.heappush(self.queue, (min(g[index], rhs[index]), index))
+
+    def update(self):
+        """Catch up with the board, sweeping or settling at most budget cells."""
+        engine = self.engine
+        if engine.board is not self.board:
+            self.reset()
+        target = self.cell(engine.cellIndex(engine.apple)) if engine.apple else None
+        if self.changed:
+            poisonCells = {engine.cellIndex(poisonApple) for poisonApple in engine.poisonousApples}
+            wormsOnCell = engine.wormsOnCell
+            for index in self.changed:
+                blocked = index in wormsOnCell or index in poisonCells
+                cell = self.cell(index)
+                if blocked != self.blocked[cell]:
+                    self.blocked[cell] = blocked
+                    self.pending.add(cell)
+            self.changed.clear()
+        if target != self.target:
+            self.retarget(target)
+
+        stride = self.stride
+        updateCell = self.updateCell
+        spent = 0
+        while True:
+            # A fresh field is a plain breadth-first search, far cheaper
+            # than settling every cell through the queue
+            g, rhs, queue, sweep, blocked = self.g, self.rhs, self.queue, self.sweep, self.blocked
+            while sweep and spent < self.budget:
+                index = sweep.popleft()
+                spent += 1
+                distance = g[index] + 1
+                for neighbour in (index - 1, index + 1, index - stride, index + stride):
+                    if g[neighbour] == self.INF and not blocked[neighbour]:
+                        g[neighbour] = rhs[neighbour] = distance
+                        sweep.append(neighbour)
+            if sweep:
+                return
+
+            # Then the cells around every change made since are repaired,
+            # unless that turns out to cost more than half a fresh sweep
+            for index in self.pending:
+                for cell in (index, index - 1, index + 1, index - stride, index + stride):
+                    updateCell(cell)
+            self.pending.clear()
+            repairs = 0
+            while queue and spent < self.budget:
+                if repairs > len(g) // 2:
+                    self.retarget(self.target)
+                    break
+                key, index = heapq.heappop(queue)
+                spent += 1
+                repairs += 1
+                if g[index] == rhs[index] or key != min(g[index], rhs[index]):
+                    continue # settled since it was queued
+                if g[index] > rhs[index]:
+                    g[index] = rhs[index] # a shorter way here opened up
+                else:
+                    g[index] = self.INF # the way here was blocked: find the next best
+                    updateCell(index)
+                for cell in (index - 1, index + 1, index - stride, index + stride):
+                    updateCell(cell)
+            else:
+                return
+
+    def distance(self, x, y):
+        """Steps from this board cell to the apple, or INF if there is no known way."""
+        return self.g[(y + 1) * self.stride + x + 1]
+
+    def direction(self, worm, direction):
+        """
+        The direction that takes this worm's head closest to the apple.
+        Walls and its own body are never chosen while there is another
+        way; without a known path it heads for the most open cell. Call
+        update() first to bring the field up to date.
+        """
+        engine = self.engine
+        g, blocked, stride = self.g, self.blocked, self.stride
+        headIndex = worm.head()
+        headx, heady = headIndex % engine.cellWidth, headIndex // engine.cellWidth
+        bestDirection, bestKey = direction, None
+        for newDirection in (UP, DOWN, LEFT, RIGHT):
+            if newDirection == OPPOSITE[direction]:
+                continue
+            dx, dy = DIRECTIONDELTAS[newDirection]
+            x, y = headx + dx, heady + dy
+            if not (0 <= x < engine.cellWidth and 0 <= y < engine.cellHeight):
+                continue
+            if y * engine.cellWidth + x in worm:
+                continue
+            cell = (y + 1) * stride + x + 1
+            openNeighbours = 4 - (blocked[cell - 1] + blocked[cell + 1] + blocked[cell - stride] + blocked[cell + stride])
+            key = (g[cell], blocked[cell], -openNeighbours, newDirection != direction)
+            if bestKey is None or key < bestKey:
+                bestDirection, bestKey = newDirection, key
+        return bestDirection
+
+    def tobytes(self):
+        """
+        The field's progress as raw bytes: a FIELDHEADER, the g, rhs and
+        blocked arrays, then the queued, swept, pending and changed cells.
+        Empty if the field has not started on the engine's board yet.
+        """
+        if self.board is not self.engine.board:
+            return b''
+        queue = array('i')
+        for key, index in self.queue:
+            queue.extend((key, index))
+        header = FIELDHEADER.pack(-1 if self.target is None else self.target,
+                                  len(self.queue), len(self.sweep), len(self.pending), len(self.changed))
+        return b''.join((header, self.g, self.rhs, self.blocked, queue,
+                         array('i', self.sweep), array('i', self.pending), array('i', self.changed)))
+
+    def restore(self, data):
+        """
+        Carry on from tobytes() on the engine's restored board, or start
+        afresh on the next update() if it was empty.
+        """
+        if not data:
+            self.board = None
+            self.changed = set()
+            return
+        target, numQueued, numSwept, numPending, numChanged = FIELDHEADER.unpack_from(data)
+        self.target = None if target < 0 else target
+        size = self.stride * (self.engine.cellHeight + 2)
+        spans = []
+        position = FIELDHEADER.size
+        for length in (4 * size, 4 * size, size, 8 * numQueued, 4 * numSwept, 4 * numPending, 4 * numChanged):
+            spans.append(data[position:position + length])
+            position += length
+        g, rhs, blocked, queue, sweep, pending, changed = spans
+        self.g, self.rhs = array('i'), array('i')
+        self.g.frombytes(g)
+        self.rhs.frombytes(rhs)
+        self.blocked = bytearray(blocked)
+        queue, sweep, pending, changed = [memoryview(span).cast('i') for span in (queue, sweep, pending, changed)]
+        self.queue = list(zip(queue[::2], queue[1::2]))
+        self.sweep = deque(sweep)
+        self.pending = set(pending)
+        self.changed = set(changed)
+        self.board = self.engine.board
+        self.board.watchers.append(self.changed)
+
+
+# Added replay recording
+class Replay:
+    """
+    A recorded game: the engine's seed and board, plus every change of
+    direction as (tick, direction). Re-simulating the same inputs from the
+    same seed plays the exact same game.
+
+    The file format (encode()/decode()) is a short header followed by one
+    varint per turn holding (ticks since the last turn << 1 | clockwise),
+    so a turn every second or two costs about a byte. Snapshots of the
+    engine every SNAPSHOTINTERVAL ticks are optional: seek() builds them
+    on first use when a file was saved without them. Saved with them, a
+    seek replays at most SNAPSHOTINTERVAL - 1 ticks, but each snapshot
+    adds about 5 KB on the default board: some 30 KB a minute of play
+    against under 100 bytes for the turns alone.
+    """
+    MAGIC = b'WRPL'
+    VERSION = 3
+
+    def __init__(self, seed, cellWidth=CELLWIDTH, cellHeight=CELLHEIGHT, tickRate=TICKRATE, numAIWorms=NUMAIWORMS,
+                 aiPathfinding=AIPATHFINDING, aiBudget=AIBUDGET):
+        self.seed = seed
+        self.cellWidth = cellWidth
+        self.cellHeight = cellHeight
+        self.tickRate = tickRate
+        self.numAIWorms = numAIWorms
+        self.aiPathfinding = aiPathfinding # how the AI worms were steered, which changes the game
+        self.aiBudget = aiBudget
+        self.ticks = 0 # ticks played
+        self.changes = [] # (tick, direction), one per tick at most
+        self.snapshots = {} # tick -> (index into changes of the next turn, compressed engine snapshot)
+
+    def newEngine(self):
+        engine = WormyEngine(self.cellWidth, self.cellHeight, self.tickRate, self.numAIWorms, self.seed)
+        engine.aiPathfinding = self.aiPathfinding
+        engine.pathfinder.budget = self.aiBudget
+        return engine
+
+    def play(self, untilTick=None, engine=None, nextChange=0):
+        """
+        Re-simulate at full speed, up to untilTick or the end of the
+        recording, and return the engine. engine and nextChange let the
+        simulation continue from a snapshot.
+        """
+        if engine is None:
+            engine = self.newEngine()
+        untilTick = self.ticks if untilTick is None else min(untilTick, self.ticks)
+        changes = self.changes
+        while engine.tick < untilTick and not engine.result:
+            action = None
+            if nextChange < len(changes) and changes[nextChange][0] == engine.tick:
+                action = changes[nextChange][1]
+                nextChange += 1
+            engine.step(action)
+        return engine
+
+    def buildSnapshots(self):
+        """Play the game through once, keeping a snapshot every SNAPSHOTINTERVAL ticks."""
+        self.snapshots = {}
+        engine = self.newEngine()
+        for tick in range(0, self.ticks + 1, SNAPSHOTINTERVAL):
+            self.play(tick, engine, bisect.bisect_left(self.changes, (engine.tick,)))
+            if engine.result:
+                break
+            self.snapshots[tick] = (bisect.bisect_left(self.changes, (tick,)),
+                                    zlib.compress(engine.snapshot()))
+
+    def seek(self, tick):
+        """
+        A new engine in the state it had at this tick: restored from the
+        nearest snapshot before it, then played forward at most
+        SNAPSHOTINTERVAL - 1 ticks.
+        """
+        if not self.snapshots:
+            self.buildSnapshots()
+        snapshotTick = min(tick // SNAPSHOTINTERVAL * SNAPSHOTINTERVAL, max(self.snapshots))
+        nextChange, state = self.snapshots[snapshotTick]
+        engine = self.newEngine()
+        engine.restore(zlib.decompress(state))
+        return self.play(tick, engine, nextChange)
+
+    def encode(self, withSnapshots=False):
+        if isinstance(self.seed, str):
+            seedBytes = self.seed.encode('utf-8')
+            seedField = b'\x01' + encodeVarint(len(seedBytes)) + seedBytes
+        else:
+            seedField = b'\x00' + encodeVarint(self.seed)
+        data = bytearray(self.MAGIC)
+        data.append(self.VERSION)
+        data += seedField
+        for value in (self.cellWidth, self.cellHeight, self.tickRate, self.numAIWorms, int(self.aiPathfinding),
+                      self.aiBudget, self.ticks, len(self.changes)):
+            data += encodeVarint(value)
+
+        lastTick, direction = -1, RIGHT
+        for tick, newDirection in self.changes:
+            clockwise = 1 if newDirection == CLOCKWISE[direction] else 0
+            data += encodeVarint((tick - lastTick - 1) << 1 | clockwise)
+            lastTick, direction = tick, newDirection
+
+        snapshots = sorted(self.snapshots.items()) if withSnapshots else []
+        data += encodeVarint(len(snapshots))
+        for tick, (nextChange, state) in snapshots:
+            data += encodeVarint(tick) + encodeVarint(nextChange) + encodeVarint(len(state)) + state
+        return bytes(data)
+
+    @classmethod
+    def decode(cls, data):
+        if data[:4] != cls.MAGIC or data[4] != cls.VERSION:
+            raise ValueError('not a Wormy replay')
+        position = 6
+        if data[5] == 1:
+            length, position = decodeVarint(data, position)
+            seed = data[position:position + length].decode('utf-8')
+            position += length
+        else:
+            seed, position = decodeVarint(data, position)
+        fields = []
+        for _ in range(8):
+            value, position = decodeVarint(data, position)
+            fields.append(value)
+        cellWidth, cellHeight, tickRate, numAIWorms, aiPathfinding, aiBudget, ticks, numChanges = fields
+        replay = cls(seed, cellWidth, cellHeight, tickRate, numAIWorms, bool(aiPathfinding), aiBudget)
+        replay.ticks = ticks
+
+        tick, direction = -1, RIGHT
+        for _ in range(numChanges):
+            value, position = decodeVarint(data, position)
+            tick += (value >> 1) + 1
+            direction = CLOCKWISE[direction] if value & 1 else OPPOSITE[CLOCKWISE[direction]]
+            replay.changes.append((tick, direction))
+
+        numSnapshots, position = decodeVarint(data, position)
+        for _ in range(numSnapshots):
+            tick, position = decodeVarint(data, position)
+            nextChange, position = decodeVarint(data, position)
+            length, position = decodeVarint(data, position)
+            replay.snapshots[tick] = (nextChange, bytes(data[position:position + length]))
+            position += length
+        return replay
+
+    def save(self, path, withSnapshots=False):
+        with open(path, 'wb') as replayFile:
+            replayFile.write(self.encode(withSnapshots))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as replayFile:
+            return cls.decode(replayFile.read())
+
+
+class ReplayRecorder:
+    """
+    Steps an engine from the start of a seeded game, just constructed or
+    reset() with its seed, and records its direction changes, and with
+    keepSnapshots the replay's snapshots too, taken as the game is played
+    so saving them costs no re-simulation.
+    """
+
+    def __init__(self, engine, keepSnapshots=False):
+        if engine.tick:
+            raise ValueError('recording has to start at tick 0, not %d' % engine.tick)
+        self.engine = engine
+        self.replay = Replay(engine.seed, engine.cellWidth, engine.cellHeight, engine.tickRate, engine.numAIWorms,
+                             engine.aiPathfinding, engine.pathfinder.budget)
+        self.keepSnapshots = keepSnapshots
+        if keepSnapshots:
+            self.takeSnapshot()
+
+    def step(self, action=None):
+        engine = self.engine
+        tick, direction = engine.tick, engine.direction
+        result = engine.step(action)
+        if engine.direction != direction:
+            self.replay.changes.append((tick, engine.direction))
+        self.replay.ticks = engine.tick
+        if self.keepSnapshots and not result and engine.tick % SNAPSHOTINTERVAL == 0:
+            self.takeSnapshot()
+        return result
+
+    def takeSnapshot(self):
+        replay = self.replay
+        replay.snapshots[self.engine.tick] = (len(replay.changes), zlib.compress(self.engine.snapshot()))
+
+    def restore(self, state):
+        """Rewind the engine to a snapshot, forgetting the turns and snapshots made since."""
+        engine = self.engine
+        engine.restore(state)
+        replay = self.replay
+        del replay.changes[bisect.bisect_left(replay.changes, (engine.tick,)):]
+        for tick in [tick for tick in replay.snapshots if tick > engine.tick]:
+            del replay.snapshots[tick]
+        replay.ticks = engine.tick
+
+
+def encodeVarint(value):
+    """An unsigned int as LEB128: 7 bits per byte, high bit set on all but the last."""
+    data = bytearray()
+    while value >= 0x80:
+        data.append(value & 0x7f | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def decodeVarint(data, position):
+    """Read a varint at position; returns (value, position after it)."""
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+# Added per-phase profiler
+class TickProfiler:
+    """
+    Times the phases of every tick and frame with perf_counter_ns().
+
+    mark(phase) charges the time since the previous mark to phase, so a
+    run of marks splits a frame into back-to-back phases at one clock read
+    each, and span(phase, start) records a phase that encloses others,
+    such as a whole tick. Each phase keeps its latest PROFILEWINDOW
+    durations for rolling percentiles, and the latest PROFILETRACE timed
+    phases are kept for writeTrace().
+
+    Profiling is off by leaving engine.profiler as None; the engine and
+    runGame() then only pay for a None test per phase.
+    """
+
+    def __init__(self, window=PROFILEWINDOW, traceLength=PROFILETRACE):
+        self.window = window
+        self.samples = {} # phase -> its latest durations in nanoseconds
+        self.events = deque(maxlen=traceLength) # (phase, start, duration) in nanoseconds
+        self.last = time.perf_counter_ns()
+
+    def start(self):
+        """Start timing from now without charging the time since the last mark to anything."""
+        self.last = time.perf_counter_ns()
+        return self.last
+
+    def mark(self, phase):
+        now = time.perf_counter_ns()
+        self.record(phase, self.last, now - self.last)
+        self.last = now
+        return now
+
+    def span(self, phase, start):
+        self.record(phase, start, time.perf_counter_ns() - start)
+
+    def record(self, phase, start, duration):
+        samples = self.samples.get(phase)
+        if samples is None:
+            samples = self.samples[phase] = deque(maxlen=self.window)
+        samples.append(duration)
+        self.events.append((phase, start, duration))
+
+    def summary(self):
+        """summarize() of each phase's recent durations, in nanoseconds."""
+        return {phase: summarize(samples) for phase, samples in self.samples.items()}
+
+    def writeTrace(self, path):
+        """
+        Save the timed phases as Chrome trace JSON, which chrome://tracing
+        and Perfetto open as a timeline, or as CSV if path ends in .csv.
+        """
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', newline='') as traceFile:
+                writer = csv.writer(traceFile)
+                writer.writerow(('phase', 'startNs', 'durationNs'))
+                writer.writerows(self.events)
+            return
+        pid = os.getpid()
+        traceEvents = [{'name': phase, 'ph': 'X', 'ts': start / 1000.0, 'dur': duration / 1000.0,
+                        'pid': pid, 'tid': 0} for phase, start, duration in self.events]
+        with open(path, 'w') as traceFile:
+            json.dump({'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}, traceFile)
+
+
+# Added background frame capture
+class FrameCapture:
+    """
+    Saves frames to disk from a worker thread, so whoever draws them
+    never waits on encoding or I/O.
+
+    capture() copies a frame into one of CAPTUREBUFFERS spare surfaces
+    made in the frame's own pixel format, so the copy is a single blit
+    with no conversion, and queues it for the worker, which writes it and
+    hands the surface back. When every spare surface is still queued the
+    frame is dropped and counted instead, unless the caller blocks to
+    wait for one, as offline rendering does.
+
+    The 'raw' format writes every frame to one file straight from the
+    surface's pixel buffer, when its layout has an ffmpeg pix_fmt name
+    (see rawPixelFormat()), or else converted to rgb24. The 'png' format
+    writes frame-000000.png and on into the path as a directory.
+    """
+
+    def __init__(self, path, format=CAPTUREFORMAT, buffers=CAPTUREBUFFERS):
+        self.path = path
+        self.format = format
+        self.buffers = buffers
+        self.spare = queue.Queue() # surfaces free to copy a frame into
+        self.pending = queue.Queue() # (frame number, surface) to write, then None to stop
+        self.captured = 0
+        self.dropped = 0
+        self.written = 0
+        self.bytesWritten = 0
+        self.size = None
+        self.pixelFormat = None
+        self.worker = None
+        self.error = None # the first error writing frames, after which they are only counted
+        self.file = None
+
+    def capture(self, surface, block=False):
+        """Queue a copy of surface to be written; False if it was dropped."""
+        if self.worker is None:
+            self.start(surface)
+        try:
+            frame = self.spare.get(block)
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        frame.blit(surface, (0, 0))
+        self.pending.put((self.captured, frame))
+        self.captured += 1
+        return True
+
+    def start(self, surface):
+        self.size = surface.get_size()
+        for _ in range(self.buffers):
+            self.spare.put(surface.copy())
+        if self.format == 'raw':
+            self.pixelFormat = rawPixelFormat(surface) or 'rgb24'
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.file = open(self.path, 'wb')
+        else:
+            os.makedirs(self.path, exist_ok=True)
+        self.worker = threading.Thread(target=self.write, name='FrameCapture', daemon=True)
+        self.worker.start()
+
+    def write(self):
+        """The worker thread: write queued frames in order until close()."""
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            number, frame = item
+            try:
+                if self.error is None:
+                    if self.file is None:
+                        framePath = os.path.join(self.path, 'frame-%06d.png' % number)
+                        pygame.image.save(frame, framePath)
+                        self.bytesWritten += os.path.getsize(framePath)
+                    elif self.pixelFormat == 'rgb24':
+                        self.bytesWritten += self.file.write(pygame.image.tobytes(frame, 'RGB'))
+                    else:
+                        self.bytesWritten += self.file.write(frame.get_view('0')) # the pixel memory itself, uncopied
+                    self.written += 1
+            except (OSError, pygame.error) as error:
+                self.error = error
+            self.spare.put(frame)
+
+    def close(self):
+        """Wait for the queued frames to be written and return what happened to every frame."""
+        if self.worker:
+            self.pending.put(None)
+            self.worker.join()
+            self.worker = None
+        if self.file:
+            self.file.close()
+            self.file = None
+        summary = {'path': self.path, 'captured': self.captured, 'written': self.written,
+                   'dropped': self.dropped, 'bytes': self.bytesWritten}
+        if self.error:
+            summary['error'] = str(self.error)
+        if self.format == 'raw' and self.size:
+            summary['ffmpeg'] = 'ffmpeg -f rawvideo -pix_fmt %s -s %dx%d -r %d -i %s %s.mp4' % (
+                self.pixelFormat, self.size[0], self.size[1], TICKRATE, self.path, os.path.splitext(self.path)[0])
+        return summary
+
+
+def rawPixelFormat(surface):
+    """
+    ffmpeg's pix_fmt name for a 32-bit surface's pixel memory, such as
+    'bgr0', or None if its rows are padded or it has some other layout.
+    """
+    if surface.get_bytesize() != 4 or surface.get_pitch() != 4 * surface.get_width():
+        return None
+    names = []
+    for byte in range(4):
+        shift = 8 * (byte if sys.byteorder == 'little' else 3 - byte)
+        for name, channelShift, mask in zip('rgba', surface.get_shifts(), surface.get_masks()):
+            if mask and channelShift == shift:
+                names.append(name)
+                break
+        else:
+            names.append('0')
+    name = ''.join(names)
+    return name if name in ('rgb0', 'bgr0', '0rgb', '0bgr', 'rgba', 'bgra', 'argb', 'abgr') else None
+
+
+def capturePath(directory, name, format):
+    """Where a capture called name is saved: a .raw file, or a directory of PNGs."""
+    return os.path.join(directory, name + '.raw' if format == 'raw' else name)
+
+
+def printCaptureSummary(summary):
+    print('%s: %d frames captured, %d written, %d dropped, %.1f MB' % (
+        summary['path'], summary['captured'], summary['written'], summary['dropped'], summary['bytes'] / 1e6))
+    if 'error' in summary:
+        print('  writing stopped: %s' % summary['error'])
+    if 'ffmpeg' in summary:
+        print('  to encode it: %s' % summary['ffmpeg'])
+
+
+def renderReplay(replay, capture):
+    """
+    Draw every tick of a replay into a FrameCapture, as fast as frames
+    can be written, and return the engine at the end of the game.
+    """
+    engine = replay.newEngine()
+    renderer = DirtyRectRenderer(DISPLAYSURF) if DIRTYRECTS else None
+    while True:
+        if renderer:
+            renderer.draw(engine)
+        else:
+            drawGame(engine)
+        capture.capture(DISPLAYSURF, block=True)
+        if engine.tick >= replay.ticks or engine.result:
+            return engine
+        replay.play(engine.tick + 1, engine, bisect.bisect_left(replay.changes, (engine.tick,)))
+
 
 def drawPressKeyMsg():
-    pressKeySurf = BASICFONT.render('Press a key to play.', True, DARKGRAY)
+    pressKeySurf = renderText('Press a key to play.', 18, DARKGRAY)
     pressKeyRect = pressKeySurf.get_rect()
     pressKeyRect.topleft = (WINDOWWIDTH - 200, WINDOWHEIGHT - 30)
     DISPLAYSURF.blit(pressKeySurf, pressKeyRect)
 
 
 def checkForKeyPress():
-    if len(pygame.event.get(QUIT)) > 0:
+    if len(pygame.event.get(pygame.QUIT)) > 0:
         terminate()
 
-    keyUpEvents = pygame.event.get(KEYUP)
+    keyUpEvents = pygame.event.get(pygame.KEYUP)
     if len(keyUpEvents) == 0:
         return None
-    if keyUpEvents[0].key == K_ESCAPE:
+    if keyUpEvents[0].key == pygame.K_ESCAPE:
         terminate()
     return keyUpEvents[0].key
 
 
-def showStartScreen():
-    titleFont = pygame.font.Font('freesansbold.ttf', 100)
-    titleSurf1 = titleFont.render('Wormy!', True, WHITE, DARKGREEN)
-    titleSurf2 = titleFont.render('Wormy!', True, GREEN)
+# Added blocking wait for screens with nothing to animate
+def waitForKeyPress():
+    """
+    Sleep in pygame.event.wait() until a key is released and return it.
+    Only QUIT and KEYUP events are let into the queue meanwhile, so an idle
+    screen wakes up for nothing else instead of polling in a busy loop.
+    """
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed([pygame.QUIT, pygame.KEYUP])
+    try:
+        while True:
+            event = pygame.event.wait()
+            if event.type == pygame.QUIT:
+                terminate()
+            elif event.type == pygame.KEYUP:
+                if event.key == pygame.K_ESCAPE:
+                    terminate()
+                return event.key
+    finally:
+        pygame.event.set_allowed(None)
+
 
+def showStartScreen():
     degrees1 = 0
     degrees2 = 0
     while True:
         DISPLAYSURF.fill(BGCOLOR)
-        rotatedSurf1 = pygame.transform.rotate(titleSurf1, degrees1)
+        rotatedSurf1 = renderRotatedText('Wormy!', 100, WHITE, DARKGREEN, degrees1)
         rotatedRect1 = rotatedSurf1.get_rect()
         rotatedRect1.center = (WINDOWWIDTH / 2, WINDOWHEIGHT / 2)
         DISPLAYSURF.blit(rotatedSurf1, rotatedRect1)
 
-        rotatedSurf2 = pygame.transform.rotate(titleSurf2, degrees2)
+        rotatedSurf2 = renderRotatedText('Wormy!', 100, GREEN, None, degrees2)
         rotatedRect2 = rotatedSurf2.get_rect()
         rotatedRect2.center = (WINDOWWIDTH / 2, WINDOWHEIGHT / 2)
         DISPLAYSURF.blit(rotatedSurf2, rotatedRect2)
@@ -398,11 +1958,12 @@ def showStartScreen():
 
         if checkForKeyPress():
             pygame.event.get() # clear event queue
+            renderRotatedText.cache_clear() # some 480 frames, tens of megabytes, not needed again
             return
         pygame.display.update()
         FPSCLOCK.tick(FPS)
-        degrees1 += 3 # rotate by 3 degrees each frame
-        degrees2 += 7 # rotate by 7 degrees each frame
+        degrees1 = (degrees1 + 3) % 360 # rotate by 3 degrees each frame
+        degrees2 = (degrees2 + 7) % 360 # rotate by 7 degrees each frame
 
 
 # Added function to calculate final score
@@ -420,26 +1981,24 @@ def calculateFinalScore(baseScore, blinkingItemsEaten):
     return baseScore + (blinkingItemsEaten * 3)
 
 
-def terminate():
+def terminate(capture=None, profiler=None):
+    if profiler:
+        profiler.writeTrace(PROFILEPATH) # the game so far, as game over would have written it
+    if capture:
+        capture.close() # the worker is still writing frames, and needs pygame to do it
     pygame.quit()
     sys.exit()
 
 
-def getRandomLocation():
-    return {'x': random.randint(0, CELLWIDTH - 1), 'y': random.randint(0, CELLHEIGHT - 1)}
-
-
 # Modified to accept game over reason and scores
 def showGameOverScreen(gameOverReason=None, baseScore=0, blinkingItemsEaten=0):
-    gameOverFont = pygame.font.Font('freesansbold.ttf', 150)
-    
     # Show different message if lost to poison
     if gameOverReason == 'poison':
-        gameSurf = gameOverFont.render('You', True, RED)
-        overSurf = gameOverFont.render('Lost!', True, RED)
+        gameSurf = renderText('You', 150, RED)
+        overSurf = renderText('Lost!', 150, RED)
     else:
-        gameSurf = gameOverFont.render('Game', True, WHITE)
-        overSurf = gameOverFont.render('Over', True, WHITE)
+        gameSurf = renderText('Game', 150, WHITE)
+        overSurf = renderText('Over', 150, WHITE)
     
     gameRect = gameSurf.get_rect()
     overRect = overSurf.get_rect()
@@ -451,17 +2010,15 @@ def showGameOverScreen(gameOverReason=None, baseScore=0, blinkingItemsEaten=0):
     
     # Display final score
     finalScore = calculateFinalScore(baseScore, blinkingItemsEaten)
-    scoreFont = pygame.font.Font('freesansbold.ttf', 36)
     scoreText = f'Final Score: {finalScore}'
-    scoreSurf = scoreFont.render(scoreText, True, WHITE)
+    scoreSurf = renderText(scoreText, 36, WHITE)
     scoreRect = scoreSurf.get_rect()
     scoreRect.midtop = (WINDOWWIDTH / 2, overRect.height + overRect.top + 50)
     DISPLAYSURF.blit(scoreSurf, scoreRect)
     
     # Display score breakdown
-    breakdownFont = pygame.font.Font('freesansbold.ttf', 18)
     breakdownText = f'Base Score: {baseScore} + Blinking Items Bonus: {blinkingItemsEaten} × 3 = {finalScore}'
-    breakdownSurf = breakdownFont.render(breakdownText, True, DARKGRAY)
+    breakdownSurf = renderText(breakdownText, 18, DARKGRAY)
     breakdownRect = breakdownSurf.get_rect()
     breakdownRect.midtop = (WINDOWWIDTH / 2, scoreRect.bottom + 20)
     DISPLAYSURF.blit(breakdownSurf, breakdownRect)
@@ -471,45 +2028,130 @@ def showGameOverScreen(gameOverReason=None, baseScore=0, blinkingItemsEaten=0):
     pygame.time.wait(500)
     checkForKeyPress() # clear out any key presses in the event queue
 
-    while True:
-        if checkForKeyPress():
-            pygame.event.get() # clear event queue
-            return
+    waitForKeyPress()
+    pygame.event.get() # clear event queue
+
+# Added font and text caching
+@functools.lru_cache(maxsize=None)
+def getFont(size):
+    """The game font at this size, loaded from disk only the first time."""
+    return pygame.font.Font('freesansbold.ttf', size)
+
+
+@functools.lru_cache(maxsize=TEXTCACHESIZE)
+def renderText(text, size, color, background=None):
+    """
+    Rendered text, memoized by (text, size, color, background) with LRU
+    eviction. The surface is shared between callers, so only blit it.
+    """
+    return getFont(size).render(text, True, color, background)
+
+
+@functools.lru_cache(maxsize=None)
+def renderRotatedText(text, size, color, background, degrees):
+    """
+    renderText() rotated by a whole number of degrees, rendered once per
+    angle. The start screen cycles through at most 360 angles per title,
+    too many for an LRU bound to help, and clears the cache once a key
+    is pressed. Text without a background is RLE encoded, which keeps
+    its mostly transparent frames small and quick to blit.
+    """
+    rotatedSurf = pygame.transform.rotate(renderText(text, size, color, background), degrees)
+    if background is None:
+        rotatedSurf = rotatedSurf.convert_alpha()
+        rotatedSurf.set_alpha(255, pygame.RLEACCEL)
+    return rotatedSurf
+
+
+def drawGame(engine):
+    """Redraw the whole window: the visible part of the board around the player's head and the score."""
+    global CAMERA
+    head = engine.worm.head()
+    CAMERA = cameraOffset(((head % engine.cellWidth) * CELLSIZE, (head // engine.cellWidth) * CELLSIZE),
+                          engine.cellWidth, engine.cellHeight)
+    DISPLAYSURF.fill(BGCOLOR)
+    drawGrid(engine.cellWidth, engine.cellHeight)
+    drawWorm(engine.worm)
+    # Draw AI worms
+    drawAIWorms(engine.aiWorms)
+    if engine.apple:
+        drawApple(engine.apple)
+    # Draw blinking items 
+    drawBlinkingItems(engine.blinkingItemsType1, engine.blinkingItemType2, engine.gameTime)
+    # Draw poisonous apples
+    drawPoisonousApples(engine.poisonousApples)
+    # Calculate and draw score with formula
+    drawScore(engine.finalScore())
+
 
 def drawScore(score):
-    scoreSurf = BASICFONT.render('Score: %s' % (score), True, WHITE)
+    scoreSurf = renderText('Score: %s' % (score), 18, WHITE)
     scoreRect = scoreSurf.get_rect()
     scoreRect.topleft = (WINDOWWIDTH - 120, 10)
     DISPLAYSURF.blit(scoreSurf, scoreRect)
+    return scoreRect
+
+
+# Added profiler overlay
+class ProfileOverlay:
+    """
+    The slowest phases of a TickProfiler with their rolling p50/p95/p99
+    in milliseconds, drawn to the left of the score. The table is only
+    rendered again every PROFILEREFRESH milliseconds.
+    """
+    COLUMNS = (('phase', 0), ('p50', 150), ('p95', 200), ('p99', 250)) # heading, right edge (0: left-aligned)
+
+    def __init__(self):
+        self.surface = None
+        self.renderedAt = 0
+        self.rect = None
+
+    def draw(self, profiler):
+        now = pygame.time.get_ticks()
+        if self.surface is None or now - self.renderedAt >= PROFILEREFRESH:
+            self.surface = self.render(profiler.summary())
+            self.renderedAt = now
+        self.rect = self.surface.get_rect(topright=(WINDOWWIDTH - 130, 10))
+        DISPLAYSURF.blit(self.surface, self.rect)
+        return self.rect
+
+    def render(self, summary):
+        phases = sorted(summary, key=lambda phase: summary[phase]['p95'], reverse=True)[:PROFILELINES]
+        rows = [[heading for heading, _ in self.COLUMNS]]
+        rows.extend([phase] + ['%.2f' % (summary[phase][p] / 1e6) for p in ('p50', 'p95', 'p99')] for phase in phases)
+        font = getFont(14)
+        lineHeight = font.get_linesize()
+        surface = pygame.Surface((self.COLUMNS[-1][1] + 4, lineHeight * len(rows) + 4))
+        surface.fill(BGCOLOR)
+        for y, row in enumerate(rows):
+            color = GRAY if y == 0 else WHITE
+            for text, (_, right) in zip(row, self.COLUMNS):
+                textSurf = font.render(text, True, color)
+                if right:
+                    surface.blit(textSurf, textSurf.get_rect(topright=(right, 2 + y * lineHeight)))
+                else:
+                    surface.blit(textSurf, (2, 2 + y * lineHeight))
+        return surface
 
 
-def drawWorm(wormCoords):
-    for coord in wormCoords:
-        x = coord['x'] * CELLSIZE
-        y = coord['y'] * CELLSIZE
-        wormSegmentRect = pygame.Rect(x, y, CELLSIZE, CELLSIZE)
-        pygame.draw.rect(DISPLAYSURF, DARKGREEN, wormSegmentRect)
-        wormInnerSegmentRect = pygame.Rect(x + 4, y + 4, CELLSIZE - 8, CELLSIZE - 8)
-        pygame.draw.rect(DISPLAYSURF, GREEN, wormInnerSegmentRect)
+def drawWorm(worm):
+    drawTiles('worm', worm.coords())
 
 
 def drawApple(coord):
-    x = coord['x'] * CELLSIZE
-    y = coord['y'] * CELLSIZE
-    appleRect = pygame.Rect(x, y, CELLSIZE, CELLSIZE)
-    pygame.draw.rect(DISPLAYSURF, RED, appleRect)
+    drawTiles('apple', [(coord['x'], coord['y'])])
 
 
-# Added function to draw second worm
-def drawSecondWorm(wormCoords):
-    """Draw the second worm in blue color to distinguish from the original."""
-    for coord in wormCoords:
-        x = coord['x'] * CELLSIZE
-        y = coord['y'] * CELLSIZE
-        wormSegmentRect = pygame.Rect(x, y, CELLSIZE, CELLSIZE)
-        pygame.draw.rect(DISPLAYSURF, BLUE, wormSegmentRect)
-        wormInnerSegmentRect = pygame.Rect(x + 4, y + 4, CELLSIZE - 8, CELLSIZE - 8)
-        pygame.draw.rect(DISPLAYSURF, CYAN, wormInnerSegmentRect)
+# Added function to draw AI worms
+def drawAIWorms(aiWorms):
+    """Draw every AI worm in its own palette colors, all in one blits() call."""
+    atlas = TILEATLAS.surface
+    areas = TILEATLAS.areas
+    camerax, cameray = CAMERA
+    DISPLAYSURF.blits([(atlas, (x * CELLSIZE - camerax, y * CELLSIZE - cameray), areas['aiWorm%d' % aiWorm.palette])
+                       for aiWorm in aiWorms for x, y in aiWorm.coords()
+                       if -CELLSIZE < x * CELLSIZE - camerax < WINDOWWIDTH
+                       and -CELLSIZE < y * CELLSIZE - cameray < WINDOWHEIGHT], False)
 
 
 # Added function to draw blinking items
@@ -520,39 +2162,333 @@ def drawBlinkingItems(blinkingItemsType1, blinkingItemType2, gameTime):
     """
     # Calculate blink state (blinks every 0.5 seconds)
     blinkState = int(gameTime * 2) % 2 == 0
-    
+    if not blinkState: # Only draw when visible
+        return
+
     # Draw type 1 blinking items (yellow)
-    for item in blinkingItemsType1:
-        if blinkState:  # Only draw when visible
-            x = item['x'] * CELLSIZE
-            y = item['y'] * CELLSIZE
-            itemRect = pygame.Rect(x, y, CELLSIZE, CELLSIZE)
-            pygame.draw.rect(DISPLAYSURF, YELLOW, itemRect)
-    
+    drawTiles('blink1', [(item['x'], item['y']) for item in blinkingItemsType1])
+
     # Draw type 2 blinking item (cyan)
-    if blinkingItemType2 and blinkState:  # Only draw when visible
-        x = blinkingItemType2['x'] * CELLSIZE
-        y = blinkingItemType2['y'] * CELLSIZE
-        itemRect = pygame.Rect(x, y, CELLSIZE, CELLSIZE)
-        pygame.draw.rect(DISPLAYSURF, CYAN, itemRect)
+    if blinkingItemType2:
+        drawTiles('blink2', [(blinkingItemType2['x'], blinkingItemType2['y'])])
 
 
 # Added function to draw poisonous apples
 def drawPoisonousApples(poisonousApples):
     """Draw poisonous apples in purple color."""
-    for poisonApple in poisonousApples:
-        x = poisonApple['x'] * CELLSIZE
-        y = poisonApple['y'] * CELLSIZE
-        appleRect = pygame.Rect(x, y, CELLSIZE, CELLSIZE)
-        pygame.draw.rect(DISPLAYSURF, PURPLE, appleRect)
+    drawTiles('poison', [(poisonApple['x'], poisonApple['y']) for poisonApple in poisonousApples])
+
+
+# Added batched tile drawing
+def drawTiles(tile, coords):
+    """Blit one atlas tile at every visible (cellx, celly) with a single blits() call."""
+    atlas = TILEATLAS.surface
+    area = TILEATLAS.areas[tile]
+    camerax, cameray = CAMERA
+    DISPLAYSURF.blits([(atlas, (x * CELLSIZE - camerax, y * CELLSIZE - cameray), area) for x, y in coords
+                       if -CELLSIZE < x * CELLSIZE - camerax < WINDOWWIDTH
+                       and -CELLSIZE < y * CELLSIZE - cameray < WINDOWHEIGHT], False)
+
+
+def drawGrid(cellWidth=CELLWIDTH, cellHeight=CELLHEIGHT):
+    """Draw the grid under the window from cached chunks of the background."""
+    camerax, cameray = CAMERA
+    chunkSize = CHUNKCELLS * CELLSIZE
+    for chunky in range(cameray // chunkSize, min(cellHeight * CELLSIZE, cameray + WINDOWHEIGHT - 1) // chunkSize + 1):
+        for chunkx in range(camerax // chunkSize, min(cellWidth * CELLSIZE, camerax + WINDOWWIDTH - 1) // chunkSize + 1):
+            chunk = getBackgroundChunk(min(CHUNKCELLS, cellWidth - chunkx * CHUNKCELLS),
+                                       min(CHUNKCELLS, cellHeight - chunky * CHUNKCELLS))
+            DISPLAYSURF.blit(chunk, (chunkx * chunkSize - camerax, chunky * chunkSize - cameray))
+
+
+@functools.lru_cache(maxsize=None)
+def getBackgroundChunk(columns, rows):
+    """
+    The grid for a block of columns x rows cells, drawn once per size.
+    Every cell looks the same, so a whole board is tiled from at most
+    four of these: full chunks and the part chunks along two edges.
+    """
+    chunk = pygame.Surface((columns * CELLSIZE, rows * CELLSIZE))
+    if pygame.display.get_surface():
+        chunk = chunk.convert()
+    chunk.fill(BGCOLOR)
+    for x in range(0, columns * CELLSIZE, CELLSIZE): # draw vertical lines
+        pygame.draw.line(chunk, DARKGRAY, (x, 0), (x, rows * CELLSIZE))
+    for y in range(0, rows * CELLSIZE, CELLSIZE): # draw horizontal lines
+        pygame.draw.line(chunk, DARKGRAY, (0, y), (columns * CELLSIZE, y))
+    return chunk
+
+
+
+# Added tile atlas
+class TileAtlas:
+    """
+    Every cell graphic in TILES rendered once, side by side on one surface.
+    areas maps a tile name to its source rectangle for blit()/blits().
+    """
+
+    def __init__(self):
+        self.surface = pygame.Surface((CELLSIZE * len(TILES), CELLSIZE))
+        if pygame.display.get_surface():
+            self.surface = self.surface.convert()
+        self.areas = {}
+        for i, (tile, (outerColor, innerColor)) in enumerate(TILES.items()):
+            area = pygame.Rect(i * CELLSIZE, 0, CELLSIZE, CELLSIZE)
+            pygame.draw.rect(self.surface, outerColor, area)
+            if innerColor:
+                pygame.draw.rect(self.surface, innerColor, area.inflate(-8, -8))
+            self.areas[tile] = area
+
+
+# Added dirty-rectangle rendering
+class DirtyRectRenderer:
+    """
+    Draws the visible part of the board by repainting only the cells that
+    changed since the last frame.
+
+    draw() returns the list of rectangles it touched, ready to be passed
+    to pygame.display.update(). The changed cells come from the engine's
+    FreeCells, which records every cell a worm or item enters or leaves.
+
+    Frames drawn between two ticks are interpolated: alpha is how far the
+    clock is towards the next tick, and each worm's head slides into its
+    new cell while its tail slides out of the cell it just left.
+
+    A board bigger than the window scrolls with the player's head. A frame
+    where the camera moved repaints the whole window, but only ever the
+    visible cells: the grid comes from cached background chunks and each
+    cell looks up its worms in the spatial index, so drawing costs the
+    same however big the board or long the worms.
+    """
+
+    def __init__(self, surface):
+        self.surface = surface
+        self.board = None
+        self.changed = set() # cells the board reported touched since the last frame
+        self.camera = None
+        self.cellWidth = None
+        self.cellHeight = None
+        self.tick = None
+        self.blinkState = None
+        self.score = None
+        self.scoreRect = pygame.Rect(0, 0, 0, 0)
+        self.cleared = []    # window rectangles to clear to the background next frame, e.g. under an overlay
+        self.wormEnds = {}   # worm -> (head, tail) as of the last tick
+        self.motions = []    # (worm, fromIndex, toIndex, cellIndex) ends sliding this tick
+        self.animated = set() # cells drawn part-way through a slide last frame
+
+    def draw(self, engine, alpha=1.0):
+        global CAMERA
+        board = engine.board
+        blinkState = int(engine.gameTime * 2) % 2 == 0
+        score = engine.finalScore()
+        cellWidth = self.cellWidth = engine.cellWidth
+        cellHeight = self.cellHeight = engine.cellHeight
+
+        newBoard = board is not self.board
+        if newBoard:
+            # A new game: start tracking its board and paint everything once
+            self.board = board
+            self.changed = set()
+            board.watchers.append(self.changed)
+            self.tick = engine.tick
+            self.wormEnds = {}
+            self.trackWorms(engine)
+            self.motions = []
+            self.animated = set()
+        elif engine.tick != self.tick:
+            self.tick = engine.tick
+            self.motions = self.trackWorms(engine)
+
+        # Where each sliding worm end is drawn this frame, in board pixels
+        slides = {}
+        headPosition = ((engine.worm.head() % cellWidth) * CELLSIZE, (engine.worm.head() // cellWidth) * CELLSIZE)
+        for worm, fromIndex, toIndex, cellIndex in self.motions:
+            fromx, fromy = (fromIndex % cellWidth) * CELLSIZE, (fromIndex // cellWidth) * CELLSIZE
+            tox, toy = (toIndex % cellWidth) * CELLSIZE, (toIndex // cellWidth) * CELLSIZE
+            position = (round(fromx + (tox - fromx) * alpha), round(fromy + (toy - fromy) * alpha))
+            slides.setdefault(cellIndex, []).append((worm, position, toIndex == cellIndex))
+            if worm is engine.worm and toIndex == cellIndex:
+                headPosition = position
+
+        camera = cameraOffset(headPosition, engine.cellWidth, engine.cellHeight, self.surface.get_size())
+        CAMERA = camera
+        camerax, cameray = camera
+        visible = visibleCells(camera, engine.cellWidth, engine.cellHeight, self.surface.get_size())
+        blinkingItems = list(engine.blinkingItemsType1)
+        if engine.blinkingItemType2:
+            blinkingItems.append(engine.blinkingItemType2)
+        animated = set(slides)
+
+        rects = []
+        repaint = newBoard or camera != self.camera
+        if repaint:
+            # Everything on screen moved: lay the grid down in chunks and
+            # paint every visible cell on top
+            self.camera = camera
+            self.changed.clear()
+            self.cleared = []
+            self.surface.fill(BGCOLOR)
+            drawGrid(engine.cellWidth, engine.cellHeight)
+            redrawScore = True
+        else:
+            dirty = set(self.changed)
+            self.changed.clear()
+            if blinkState != self.blinkState:
+                dirty.update(engine.cellIndex(item) for item in blinkingItems)
+
+            # Cells with a sliding worm end are repainted every frame, and
+            # once more when the slide is over.
+            dirty.update(animated, self.animated)
+
+            # The score is drawn over the board, so what is under it is
+            # restored whenever the text or anything beneath it changes:
+            # the cells, and the bare background where a small board
+            # leaves the window empty.
+            scoreCells = self.cellsUnder(self.scoreRect.move(camerax, cameray), cellWidth, cellHeight)
+            redrawScore = (score != self.score or not dirty.isdisjoint(scoreCells)
+                           or self.scoreRect.collidelist(self.cleared) >= 0)
+            if redrawScore:
+                dirty.update(scoreCells)
+                self.cleared.append(self.scoreRect)
+            for rect in self.cleared:
+                self.surface.fill(BGCOLOR, rect)
+                rects.append(rect)
+            self.cleared = []
+            dirty.intersection_update(visible)
+        self.blinkState = blinkState
+        self.animated = animated
+
+        # Which tile goes on each item cell, in the same order drawing would
+        itemTiles = {}
+        if engine.apple:
+            itemTiles[engine.cellIndex(engine.apple)] = 'apple'
+        if blinkState:
+            for item in blinkingItems:
+                itemTiles[engine.cellIndex(item)] = 'blink1' if item['type'] == 1 else 'blink2'
+        for poisonApple in engine.poisonousApples:
+            itemTiles[engine.cellIndex(poisonApple)] = 'poison'
+
+        # Worms are stacked in the order a full redraw would paint them
+        wormTiles = {engine.worm: 'worm'}
+        for aiWorm in engine.aiWorms:
+            wormTiles[aiWorm] = 'aiWorm%d' % aiWorm.palette
+        drawOrder = {worm: i for i, worm in enumerate(wormTiles)}
+
+        wormsOnCell = engine.wormsOnCell
+        if repaint:
+            # The grid is down already; only cells with something on them need painting
+            dirty = [index for index in visible if index in wormsOnCell or index in itemTiles or index in animated]
+
+        # Restore each dirty cell from the background and stack its tiles
+        # on top, all in one blits() batch. The spatial index says which
+        # worms are on a cell, so this doesn't grow with the number of worms.
+        atlas = TILEATLAS.surface
+        areas = TILEATLAS.areas
+        cellBackground = getBackgroundChunk(1, 1)
+        blitSequence = []
+        for index in dirty:
+            x = (index % cellWidth) * CELLSIZE - camerax
+            y = (index // cellWidth) * CELLSIZE - cameray
+            cellRect = pygame.Rect(x, y, CELLSIZE, CELLSIZE)
+            if not repaint:
+                blitSequence.append((cellBackground, cellRect))
+                rects.append(cellRect)
+            cellSlides = slides.get(index, ())
+            worms = set(wormsOnCell.get(index, ()))
+            worms.update(slideWorm for slideWorm, _, _ in cellSlides)
+            for worm in sorted(worms, key=drawOrder.__getitem__):
+                tile = wormTiles[worm]
+                slidingHead = False
+                for slideWorm, position, isHead in cellSlides:
+                    if slideWorm is worm:
+                        # the part of the moving tile that is inside this cell
+                        tileRect = pygame.Rect(position[0] - camerax, position[1] - cameray, CELLSIZE, CELLSIZE)
+                        clipped = tileRect.clip(cellRect)
+                        area = clipped.move(areas[tile].x - tileRect.x, areas[tile].y - tileRect.y)
+                        blitSequence.append((atlas, clipped, area))
+                        slidingHead = slidingHead or isHead
+                if not slidingHead and index in worm:
+                    blitSequence.append((atlas, cellRect, areas[tile]))
+            if index in itemTiles:
+                blitSequence.append((atlas, cellRect, areas[itemTiles[index]]))
+        self.surface.blits(blitSequence, False)
+
+        if redrawScore:
+            self.scoreRect = drawScore(score)
+            self.score = score
+            rects.append(self.scoreRect)
+        if repaint:
+            return [self.surface.get_rect()]
+        return rects
+
+    def invalidate(self, rect):
+        """Repaint what is under a window rectangle, such as an overlay, next frame."""
+        if self.camera is not None:
+            self.changed.update(self.cellsUnder(rect.move(self.camera), self.cellWidth, self.cellHeight))
+            self.cleared.append(pygame.Rect(rect))
+
+    def trackWorms(self, engine):
+        """
+        Note where each worm's head and tail are now and return the ends
+        that moved to a neighbouring cell since the last tick, as
+        (worm, fromIndex, toIndex, cellIndex) where cellIndex is the cell
+        the sliding tile is drawn in: the new head cell, or the cell the
+        tail just left.
+        """
+        motions = []
+        cellWidth = engine.cellWidth
+        wormEnds = {}
+        for worm in [engine.worm] + engine.aiWorms:
+            head, tail = worm.head(), worm.tail()
+            wormEnds[worm] = (head, tail)
+            last = self.wormEnds.get(worm)
+            if last is None:
+                continue # a worm that just appeared has nothing to slide
+            lastHead, lastTail = last
+            if isAdjacent(lastHead, head, cellWidth):
+                motions.append((worm, lastHead, head, head))
+            if lastTail not in worm and isAdjacent(lastTail, tail, cellWidth):
+                motions.append((worm, lastTail, tail, lastTail))
+        self.wormEnds = wormEnds
+        return motions
+
+    def cellsUnder(self, rect, cellWidth, cellHeight):
+        """Indices of the board cells a rectangle in board pixels overlaps."""
+        return {y * cellWidth + x
+                for y in range(max(0, rect.top // CELLSIZE), min(cellHeight, (rect.bottom - 1) // CELLSIZE + 1))
+                for x in range(max(0, rect.left // CELLSIZE), min(cellWidth, (rect.right - 1) // CELLSIZE + 1))}
+
+
+# Added scrolling camera
+def cameraOffset(position, cellWidth, cellHeight, windowSize=(WINDOWWIDTH, WINDOWHEIGHT)):
+    """
+    The board pixel at the window's top left corner that centres the cell
+    drawn at position (board pixels), without showing past the board's
+    edges. A board that fits in the window never scrolls.
+    """
+    offset = []
+    for cellPosition, boardSize, windowLength in zip(position, (cellWidth * CELLSIZE, cellHeight * CELLSIZE), windowSize):
+        centred = cellPosition + CELLSIZE // 2 - windowLength // 2
+        offset.append(max(0, min(centred, boardSize - windowLength)))
+    return tuple(offset)
+
+
+def visibleCells(camera, cellWidth, cellHeight, windowSize=(WINDOWWIDTH, WINDOWHEIGHT)):
+    """Indices of the board cells that show in the window at this camera offset."""
+    camerax, cameray = camera
+    columns = range(camerax // CELLSIZE, min(cellWidth, (camerax + windowSize[0] - 1) // CELLSIZE + 1))
+    return [y * cellWidth + x
+            for y in range(cameray // CELLSIZE, min(cellHeight, (cameray + windowSize[1] - 1) // CELLSIZE + 1))
+            for x in columns]
 
 
-def drawGrid():
-    for x in range(0, WINDOWWIDTH, CELLSIZE): # draw vertical lines
-        pygame.draw.line(DISPLAYSURF, DARKGRAY, (x, 0), (x, WINDOWHEIGHT))
-    for y in range(0, WINDOWHEIGHT, CELLSIZE): # draw horizontal lines
-        pygame.draw.line(DISPLAYSURF, DARKGRAY, (0, y), (WINDOWWIDTH, y))
+def isAdjacent(index1, index2, cellWidth):
+    """True if two cell indices are side by side horizontally or vertically."""
+    y1, x1 = divmod(index1, cellWidth)
+    y2, x2 = divmod(index2, cellWidth)
+    return abs(x1 - x2) + abs(y1 - y2) == 1
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    runCommandLine(sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,400 @@
+# Wormy benchmarks: simulation throughput and rendering cost
+# Plays scripted WormyEngine games headlessly and times every tick, then
+# draws the same games into an offscreen surface with the SDL dummy video
+# driver. Results go to JSON, and a saved baseline turns any metric that
+# got worse by more than a tolerance into a reported regression. Tick
+# latencies are in microseconds, frame times in milliseconds, and so is the
+# cold start of a simulation-only run, timed in fresh interpreters.
+# Snapshots and restores of a game, with and without the AI's distance
+# field, are counted per second.
+#
+# --check instead verifies that seeks, rewinds and replays reproduce a game
+# exactly on a board too big for one tick's AI budget.
+#
+#   python wormlybench.py --output bench.json
+#   python wormlybench.py --baseline bench.json --output new.json
+#   python wormlybench.py --check
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse, bisect, json, platform, subprocess, sys, time
+from collections import deque
+import wormly
+from wormly import UP, DOWN, LEFT, RIGHT
+
+BENCHTICKS = 3000 # ticks timed per simulation scenario
+RENDERTICKS = 300 # ticks drawn per rendering scenario
+FRAMESPERTICK = 4 # interpolated frames drawn per tick, as runGame() does at 60 fps
+SEGMENTTICKS = 100 # ticks played before the scenario is restored to its starting state
+CHECKBOARD = (100, 100) # board of the determinism check, big enough that a distance field sweep spans several ticks
+CHECKAIWORMS = 4
+CHECKTICKS = 1200 # ticks played in the determinism check, rewinding REWINDTICKS at CHECKREWIND
+CHECKREWIND = 600
+REWINDTICKS = 15
+STARTUPRUNS = 15 # fresh interpreters timed for each cold start measurement
+SNAPSHOTRUNS = 5000 # snapshots and restores timed each way
+SNAPSHOTSCENARIO = {'board': (wormly.CELLWIDTH, wormly.CELLHEIGHT), 'length': 10, 'poison': 0, 'blinking': 0,
+                    'aiWorms': 1, 'pathfinding': True} # the default board, distance field included
+TOLERANCE = 0.15 # relative change a metric may show against the baseline before it is a regression
+
+# Every scenario varies one setting from BASESCENARIO, or several in COMBINATIONS
+BASESCENARIO = {'board': (128, 128), 'length': 10, 'poison': 0, 'blinking': 0, 'aiWorms': 0, 'pathfinding': True}
+SWEEPS = (('board', [(32, 24), (128, 128), (512, 512), (1024, 1024)]),
+          ('length', [10, 100, 1000, 5000]),
+          ('poison', [0, 5, 50, 200]),
+          ('blinking', [0, 3, 30, 200]),
+          ('aiWorms', [0, 1]))
+COMBINATIONS = ({'aiWorms': 1, 'pathfinding': False}, # the wandering AI that --headless and --batch default to
+                {'board': (512, 512), 'aiWorms': 1},
+                {'board': (512, 512), 'aiWorms': 1, 'pathfinding': False})
+
+# Whether a bigger value of each metric is better, for comparing with a baseline
+METRICS = {'ticksPerSecond': True, 'tickP50': False, 'tickP95': False, 'tickP99': False,
+           'dirtyP50': False, 'dirtyP95': False, 'fullP50': False, 'fullP95': False,
+           'importP50': False, 'headlessP50': False,
+           'snapshotsPerSecond': True, 'restoresPerSecond': True, 'snapshotBytes': False,
+           'clonesPerSecond': True, 'cloneRestoresPerSecond': True, 'cloneBytes': False}
+
+# Cold start commands, timed in fresh interpreters against a bare one
+STARTUPCOMMANDS = {'python': ['-c', 'pass'],
+                   'import': ['-c', 'import wormly'],
+                   'headless': ['wormlyheadless.py', '--max-ticks', '1']}
+
+
+def scenarios():
+    """(name, settings) for every scenario, the base one first."""
+    found = {}
+    changes = [{setting: value} for setting, values in SWEEPS for value in values]
+    for change in changes + list(COMBINATIONS):
+        settings = dict(BASESCENARIO, **change)
+        found.setdefault(scenarioName(settings), settings)
+    return list(found.items())
+
+
+def scenarioName(settings):
+    width, height = settings['board']
+    name = 'board=%dx%d length=%d poison=%d blinking=%d aiWorms=%d' % (
+        width, height, settings['length'], settings['poison'], settings['blinking'], settings['aiWorms'])
+    if settings['aiWorms'] and not settings['pathfinding']:
+        name += ' wandering' # AI worms that do not pathfind
+    return name
+
+
+def cycleDirections(cellWidth, cellHeight):
+    """
+    The cells of a loop through every cell of an even-height board, in
+    order, and the direction that leads from each cell to the next.
+
+    The loop runs right along the top row, snakes back and forth through
+    the other rows without their first column, and returns up that
+    column, so a worm following it never runs into itself.
+    """
+    order = list(range(cellWidth))
+    for y in range(1, cellHeight):
+        row = range(cellWidth - 1, 0, -1) if y % 2 else range(1, cellWidth)
+        order.extend(y * cellWidth + x for x in row)
+    order.extend(y * cellWidth for y in range(cellHeight - 1, 0, -1))
+    directions = [None] * len(order)
+    for i, index in enumerate(order):
+        following = order[(i + 1) % len(order)]
+        directions[index] = {1: RIGHT, -1: LEFT, cellWidth: DOWN, -cellWidth: UP}[following - index]
+    return order, directions
+
+
+def buildEngine(settings, seed=0):
+    """
+    A WormyEngine set up for a scenario: the player worm laid along the
+    loop from cycleDirections() at the given length, with the given
+    number of poisonous apples, never-expiring blinking items and AI
+    worms, pathfinding or wandering, already on the board.
+    """
+    cellWidth, cellHeight = settings['board']
+    if cellHeight % 2 or settings['length'] >= cellWidth * cellHeight // 2:
+        raise ValueError('%s: board too small or of odd height' % scenarioName(settings))
+    engine = wormly.WormyEngine(cellWidth, cellHeight, numAIWorms=0, seed=seed)
+    engine.aiPathfinding = settings['pathfinding']
+    order, directions = cycleDirections(cellWidth, cellHeight)
+    engine.worm.clear()
+    for index in order[:settings['length']]:
+        engine.worm.pushHead(index)
+    engine.direction = directions[engine.worm.head()]
+    engine.numPoisonousApples = settings['poison']
+    for _ in range(settings['poison']):
+        engine.poisonousApples.append(engine.getRandomLocation())
+    for _ in range(settings['blinking']):
+        item = engine.getRandomLocation()
+        item['spawnTick'] = -1 # no expireType1 event matches it
+        item['type'] = 1
+        engine.blinkingItemsType1.append(item)
+    for number in range(settings['aiWorms']):
+        engine.spawnAIWorm(number)
+    return engine, directions
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))]
+
+
+def benchSimulation(settings, numTicks=BENCHTICKS):
+    """
+    Time numTicks engine steps one by one. The game is restored to the
+    scenario's starting state every SEGMENTTICKS ticks and whenever it
+    ends, outside the timed steps, so the worm length and item counts
+    stay near the scenario's.
+    """
+    engine, directions = buildEngine(settings)
+    start = engine.snapshot()
+    step = engine.step
+    clock = time.perf_counter_ns
+    latencies = []
+    while len(latencies) < numTicks:
+        engine.restore(start)
+        for _ in range(SEGMENTTICKS):
+            direction = directions[engine.worm.head()]
+            before = clock()
+            result = step(direction)
+            latencies.append(clock() - before)
+            if result:
+                break
+    latencies = sorted(latencies[:numTicks])
+    return {'ticksPerSecond': len(latencies) / (sum(latencies) / 1e9),
+            'tickP50': percentile(latencies, 50) / 1e3,
+            'tickP95': percentile(latencies, 95) / 1e3,
+            'tickP99': percentile(latencies, 99) / 1e3}
+
+
+def benchRendering(settings, numTicks=RENDERTICKS):
+    """
+    Milliseconds per frame drawn into offscreen window-sized surfaces,
+    both by the DirtyRectRenderer at FRAMESPERTICK interpolated frames a
+    tick and by a full drawGame() redraw once a tick.
+    """
+    engine, directions = buildEngine(settings)
+    start = engine.snapshot()
+    surface = wormly.pygame.Surface((wormly.WINDOWWIDTH, wormly.WINDOWHEIGHT))
+    fullSurface = surface.copy()
+    clock = time.perf_counter_ns
+    dirty, full = [], []
+    while len(full) < numTicks:
+        engine.restore(start)
+        renderer = wormly.DirtyRectRenderer(surface)
+        wormly.DISPLAYSURF = surface
+        renderer.draw(engine) # the first frame of a board paints everything
+        for _ in range(SEGMENTTICKS):
+            if engine.step(directions[engine.worm.head()]):
+                break
+            wormly.DISPLAYSURF = surface
+            for frame in range(1, FRAMESPERTICK + 1):
+                before = clock()
+                renderer.draw(engine, frame / FRAMESPERTICK)
+                dirty.append(clock() - before)
+            wormly.DISPLAYSURF = fullSurface
+            before = clock()
+            wormly.drawGame(engine)
+            full.append(clock() - before)
+    dirty.sort()
+    full.sort()
+    return {'dirtyP50': percentile(dirty, 50) / 1e6, 'dirtyP95': percentile(dirty, 95) / 1e6,
+            'fullP50': percentile(full, 50) / 1e6, 'fullP95': percentile(full, 95) / 1e6}
+
+
+def benchStartup(runs=STARTUPRUNS):
+    """
+    Median milliseconds from launching a fresh interpreter until it exits,
+    for a bare one and for each of STARTUPCOMMANDS, minus the bare
+    interpreter's time: what importing wormly and playing a one-tick
+    headless game add to the start of a simulation-only run.
+    """
+    directory = os.path.dirname(os.path.abspath(wormly.__file__))
+    medians = {}
+    for name, command in STARTUPCOMMANDS.items():
+        times = []
+        for _ in range(runs):
+            before = time.perf_counter_ns()
+            subprocess.run([sys.executable] + command, cwd=directory, stdout=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter_ns() - before)
+        medians[name] = percentile(sorted(times), 50) / 1e6
+    return {'pythonP50': medians['python'],
+            'importP50': max(0.0, medians['import'] - medians['python']),
+            'headlessP50': max(0.0, medians['headless'] - medians['python'])}
+
+
+def benchSnapshots(settings=SNAPSHOTSCENARIO, runs=SNAPSHOTRUNS):
+    """
+    Snapshots and restores per second of a game SEGMENTTICKS ticks in,
+    and their size in bytes: whole ones, as rewinds and replays take,
+    and clones without the distance field, as a lookahead takes.
+    """
+    engine, directions = buildEngine(settings)
+    for _ in range(SEGMENTTICKS):
+        if engine.step(directions[engine.worm.head()]):
+            break
+    clock = time.perf_counter_ns
+    rates = []
+    for withField in (True, False):
+        state = engine.snapshot(withField)
+        before = clock()
+        for _ in range(runs):
+            engine.snapshot(withField)
+        snapshotTime = clock() - before
+        before = clock()
+        for _ in range(runs):
+            engine.restore(state)
+        restoreTime = clock() - before
+        rates.append((runs / (snapshotTime / 1e9), runs / (restoreTime / 1e9), len(state)))
+    (snapshots, restores, snapshotBytes), (clones, cloneRestores, cloneBytes) = rates
+    return {'snapshotsPerSecond': snapshots, 'restoresPerSecond': restores, 'snapshotBytes': snapshotBytes,
+            'clonesPerSecond': clones, 'cloneRestoresPerSecond': cloneRestores, 'cloneBytes': cloneBytes}
+
+
+def runBenchmarks(numTicks=BENCHTICKS, renderTicks=RENDERTICKS, render=True, only=None, log=None):
+    """Run every scenario whose name contains only, returning the JSON-ready results."""
+    if render:
+        wormly.initDisplay()
+    results = {}
+    if not only or only in 'startup':
+        results['startup'] = benchStartup()
+        if log:
+            log('startup', results['startup'])
+    if not only or only in 'snapshots':
+        results['snapshots'] = benchSnapshots()
+        if log:
+            log('snapshots', results['snapshots'])
+    for name, settings in scenarios():
+        if only and only not in name:
+            continue
+        result = benchSimulation(settings, numTicks)
+        if render:
+            result.update(benchRendering(settings, renderTicks))
+        results[name] = result
+        if log:
+            log(name, result)
+    return {'machine': {'python': platform.python_version(),
+                        'pygame': wormly.pygame.version.ver if wormly.pygame else None,
+                        'platform': platform.platform(), 'processor': platform.processor()},
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'settings': {'ticks': numTicks, 'renderTicks': renderTicks, 'framesPerTick': FRAMESPERTICK},
+            'results': results}
+
+
+def gameState(engine):
+    """What a player sees of a game: the tick, every worm's body, the items and the result."""
+    return (engine.tick, engine.worm.tobytes(), [aiWorm.tobytes() for aiWorm in engine.aiWorms],
+            engine.apple, engine.blinkingItemsType1, engine.blinkingItemType2, engine.poisonousApples, engine.result)
+
+
+def checkDeterminism(seed=0, numTicks=CHECKTICKS):
+    """
+    Record a greedy bot's game on CHECKBOARD with CHECKAIWORMS AI worms,
+    rewinding it REWINDTICKS ticks once at CHECKREWIND as BACKSPACE does,
+    then check that its replay plays the live game out to the same end,
+    and that seeking to every tenth tick, through snapshots, lands in the
+    same state as playing up to it. Returns a list of what differed.
+    """
+    engine = wormly.WormyEngine(*CHECKBOARD, numAIWorms=CHECKAIWORMS, seed=seed)
+    recorder = wormly.ReplayRecorder(engine)
+    rewindStates = deque(maxlen=REWINDTICKS)
+    rewound = False
+    while engine.tick < numTicks and not engine.result:
+        if engine.tick == CHECKREWIND and not rewound:
+            recorder.restore(rewindStates[0])
+            rewound = True
+        rewindStates.append(engine.snapshot())
+        recorder.step(wormly.greedyDirection(engine))
+    replay = recorder.replay
+
+    failures = []
+    if gameState(replay.play()) != gameState(engine):
+        failures.append('replay of the rewound game ends differently from the live game')
+    replay.buildSnapshots()
+    played = replay.newEngine()
+    for tick in range(0, replay.ticks, 10):
+        replay.play(tick, played, bisect.bisect_left(replay.changes, (played.tick,)))
+        if gameState(replay.seek(tick)) != gameState(played):
+            failures.append('seek(%d) differs from playing up to tick %d' % (tick, tick))
+    return failures
+
+
+def compareResults(results, baseline, tolerance=TOLERANCE):
+    """
+    (scenario, metric, baseline value, new value, relative change) for
+    every metric of a scenario in both runs, and the list of those that
+    got worse by more than tolerance.
+    """
+    changes = []
+    regressions = []
+    for name, metrics in results['results'].items():
+        before = baseline['results'].get(name, {})
+        for metric, higherIsBetter in METRICS.items():
+            if metric not in metrics or not before.get(metric):
+                continue
+            change = metrics[metric] / before[metric] - 1.0
+            row = (name, metric, before[metric], metrics[metric], change)
+            changes.append(row)
+            if (-change if higherIsBetter else change) > tolerance:
+                regressions.append(row)
+    return changes, regressions
+
+
+def printResult(name, result):
+    if 'importP50' in result:
+        print('%-66s python %6.1f ms  import wormly +%6.1f ms  headless game +%6.1f ms' % (
+            name, result['pythonP50'], result['importP50'], result['headlessP50']))
+        sys.stdout.flush()
+        return
+    if 'snapshotsPerSecond' in result:
+        print('%-66s %7.0f snapshots/s %7.0f restores/s %7d bytes, without the field %7.0f/s %7.0f/s %7d bytes' % (
+            name, result['snapshotsPerSecond'], result['restoresPerSecond'], result['snapshotBytes'],
+            result['clonesPerSecond'], result['cloneRestoresPerSecond'], result['cloneBytes']))
+        sys.stdout.flush()
+        return
+    print('%-66s %9.0f ticks/s  p50 %7.1f us  p99 %8.1f us' % (
+        name, result['ticksPerSecond'], result['tickP50'], result['tickP99']), end='')
+    if 'dirtyP50' in result:
+        print('  dirty %6.3f ms  full %6.3f ms' % (result['dirtyP50'], result['fullP50']), end='')
+    print()
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Wormy simulation and rendering benchmarks')
+    parser.add_argument('--output', metavar='PATH', help='write the results here as JSON')
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='compare with results saved by an earlier run; exits 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='relative change allowed before a metric counts as a regression')
+    parser.add_argument('--ticks', type=int, default=BENCHTICKS, help='ticks timed per scenario')
+    parser.add_argument('--render-ticks', type=int, default=RENDERTICKS, help='ticks drawn per scenario')
+    parser.add_argument('--no-render', action='store_true', help='skip the rendering benchmarks')
+    parser.add_argument('--only', metavar='TEXT', help='run only the scenarios whose name contains TEXT')
+    parser.add_argument('--check', action='store_true',
+                        help='check that seeks, rewinds and replays reproduce games exactly; exits 1 if not')
+    args = parser.parse_args(argv)
+
+    if args.check:
+        failures = checkDeterminism()
+        for failure in failures:
+            print('MISMATCH', failure)
+        print('determinism check on a %dx%d board: %d mismatches' % (CHECKBOARD + (len(failures),)))
+        return 1 if failures else 0
+
+    results = runBenchmarks(args.ticks, args.render_ticks, not args.no_render, args.only, printResult)
+    if args.output:
+        with open(args.output, 'w') as outputFile:
+            json.dump(results, outputFile, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile)
+        changes, regressions = compareResults(results, baseline, args.tolerance)
+        for name, metric, before, after, change in regressions:
+            print('REGRESSION %-66s %-14s %10.3f -> %10.3f (%+.0f%%)' % (name, metric, before, after, 100 * change))
+        print('%d metrics compared, %d regressions beyond %.0f%%' % (len(changes), len(regressions),
+                                                                      100 * args.tolerance))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,13 @@
+# Wormy without a window: plays one game with a bot at the controls and
+# prints its result. Same as "python wormly.py --headless", but a script
+# run directly is compiled from source on every start, and this one is
+# small enough that wormly comes from its cached bytecode instead. pygame
+# is never imported.
+#
+#   python wormlyheadless.py --seed 7 --bot autopilot --board 64x48
+
+import sys
+import wormly
+
+if __name__ == '__main__':
+    wormly.runCommandLine(['--headless'] + sys.argv[1:])
@@ -0,0 +1,456 @@
+# Wormy multiplayer server: shared rooms played over TCP and WebSocket
+# The server runs every room's WormyEngine itself, on one tick clock, and
+# clients only send turns. After each tick a room sends one message with
+# what changed: new heads, how many tail segments each worm lost, worms
+# that appeared or died and items that appeared or went away. Traffic so
+# grows with what happens on the board, not with its size.
+#
+#   python wormlyserver.py --port 8765
+#   python wormlyserver.py --load 200 --port 8765    (a local load test)
+#
+# Every message is a JSON object. TCP clients send and receive one per
+# line; WebSocket clients (an HTTP upgrade on the same port) one per text
+# frame. A client sends {"join": ROOM} first, then {"turn": "up"} and so
+# on. The server answers a join with {"seat": N, "state": STATE} and then
+# sends one delta per tick, using these keys:
+#
+#   t   the tick the delta brings the board to
+#   h   [worm, cell] the new head of each worm that moved
+#   x   [worm, n] each worm that lost its last n tail segments
+#   w   [worm, palette, seat, cells] each worm that appeared, head first
+#   k   worm ids that died
+#   +   [tile, cell] items that appeared ('apple', 'blink1', 'blink2', 'poison')
+#   -   [tile, cell] items that went away
+#   over  [gameOverReason, baseScore, blinkingItemsEaten] when the round ends;
+#         a {"state": STATE} with the new round follows
+#
+# Cells are indices y * width + x. Seat 0 plays the engine's own worm
+# (palette -1), whose death ends the round; the other seats steer AI worms.
+
+import argparse, asyncio, base64, hashlib, json, random, struct, sys, time
+from collections import deque
+import wormly
+from wormly import UP, DOWN, LEFT, RIGHT, OPPOSITE, TICKRATE, BOARDWIDTH, BOARDHEIGHT
+
+HOST = '127.0.0.1'
+PORT = 8765
+ROOMSIZE = 8 # seats per room; more clients join as spectators
+RESPAWNTICKS = TICKRATE * 2 # ticks a seat waits for a new worm after its worm dies
+MAXBUFFER = 256 * 1024 # bytes queued for one client before it is dropped as too slow
+MAXMESSAGE = 4096 # longest message a client may send
+MAXLATETICKS = 5 # ticks the server catches up on before it slows down instead
+WEBSOCKETGUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+DIRECTIONS = (UP, DOWN, LEFT, RIGHT)
+
+
+class Client:
+    """One connection: how to send to it, where it sits and the turns it has queued."""
+    __slots__ = ('writer', 'websocket', 'room', 'seat', 'turns')
+
+    def __init__(self, writer, websocket):
+        self.writer = writer
+        self.websocket = websocket
+        self.room = None
+        self.seat = None # None for a spectator
+        self.turns = deque()
+
+    def send(self, line, frame):
+        """Queue an encoded message without waiting; False if the client has fallen too far behind."""
+        transport = self.writer.transport
+        if transport.is_closing() or transport.get_write_buffer_size() > MAXBUFFER:
+            return False
+        self.writer.write(frame if self.websocket else line)
+        return True
+
+    def close(self):
+        if not self.writer.transport.is_closing():
+            self.writer.close()
+
+
+class Room:
+    """
+    One shared board and the clients on it.
+
+    step() plays a tick with each seat's next queued turn and sends the
+    delta to everyone. A vacant seat 0 is played by the greedy bot, so a
+    room keeps going while anyone is watching. A seat's AI worm comes back
+    RESPAWNTICKS after it dies.
+    """
+
+    def __init__(self, name, cellWidth=BOARDWIDTH, cellHeight=BOARDHEIGHT, roomSize=ROOMSIZE):
+        self.name = name
+        self.roomSize = roomSize
+        self.engine = wormly.WormyEngine(cellWidth, cellHeight, numAIWorms=0, seed=random.getrandbits(63))
+        self.clients = []
+        self.seats = {} # seat -> Client
+        self.startRound()
+
+    def newRound(self):
+        self.engine.reset(random.getrandbits(63))
+        self.startRound()
+
+    def startRound(self):
+        """Follow the engine's freshly reset game from its first tick."""
+        engine = self.engine
+        self.seatWorms = {} # seat -> its steered AIWorm
+        self.respawns = {seat: engine.tick for seat in self.seats if seat} # seat -> tick its worm (re)appears
+        self.wormIds = {engine.worm: 0} # worm -> id used in messages
+        self.wormSeats = {engine.worm: 0}
+        self.nextWormId = 1
+        self.sent = {engine.worm: (engine.worm.head(), len(engine.worm))} # worm -> (head, length) clients have
+        self.items = self.itemCells()
+
+    def join(self, client):
+        seat = next((seat for seat in range(self.roomSize) if seat not in self.seats), None)
+        client.room, client.seat = self, seat
+        self.clients.append(client)
+        if seat is not None:
+            self.seats[seat] = client
+            if seat:
+                self.respawns[seat] = self.engine.tick
+        message = json.dumps({'seat': seat, 'state': self.state()}, separators=(',', ':')).encode() + b'\n'
+        client.send(message, websocketFrame(message))
+
+    def leave(self, client):
+        self.clients.remove(client)
+        if client.seat is not None:
+            del self.seats[client.seat]
+            self.respawns.pop(client.seat, None)
+            worm = self.seatWorms.pop(client.seat, None)
+            if worm:
+                worm.steered = False # the worm plays on as an ordinary AI worm
+                self.wormSeats.pop(worm)
+
+    def state(self):
+        """The whole board, for a client that has nothing yet."""
+        engine = self.engine
+        return {'tick': engine.tick, 'board': [engine.cellWidth, engine.cellHeight],
+                'worms': [self.describe(worm) for worm in self.sent],
+                'items': sorted(self.items)}
+
+    def describe(self, worm):
+        palette = worm.palette if worm is not self.engine.worm else -1
+        return [self.wormIds[worm], palette, self.wormSeats.get(worm), list(worm)]
+
+    def itemCells(self):
+        engine = self.engine
+        items = {('poison', engine.cellIndex(poisonApple)) for poisonApple in engine.poisonousApples}
+        items.update(('blink1', engine.cellIndex(item)) for item in engine.blinkingItemsType1)
+        if engine.blinkingItemType2:
+            items.add(('blink2', engine.cellIndex(engine.blinkingItemType2)))
+        if engine.apple:
+            items.add(('apple', engine.cellIndex(engine.apple)))
+        return items
+
+    def nextTurn(self, seat, direction):
+        """The direction a seat's worm takes this tick: its next queued turn, unless that reverses it."""
+        client = self.seats.get(seat)
+        if client and client.turns:
+            turn = client.turns.popleft()
+            if turn != OPPOSITE[direction]:
+                return turn
+        return direction
+
+    def step(self):
+        engine = self.engine
+        action = self.nextTurn(0, engine.direction) if 0 in self.seats else wormly.greedyDirection(engine)
+        for seat, worm in self.seatWorms.items():
+            worm.direction = self.nextTurn(seat, worm.direction)
+        result = engine.step(action)
+
+        for seat, tick in list(self.respawns.items()):
+            if tick <= engine.tick:
+                worm = engine.placeAIWorm(seat)
+                if worm:
+                    worm.steered = True
+                    worm.direction = RIGHT # away from its own body
+                    self.seatWorms[seat] = worm
+                    self.wormSeats[worm] = seat
+                    del self.respawns[seat]
+        for seat, worm in list(self.seatWorms.items()):
+            if not len(worm):
+                del self.seatWorms[seat] # died this tick
+                self.respawns[seat] = engine.tick + RESPAWNTICKS
+
+        delta = self.delta()
+        if result:
+            delta['over'] = list(result)
+        self.broadcast(delta)
+        if result:
+            self.newRound()
+            self.broadcast({'state': self.state()})
+
+    def delta(self):
+        """What changed since the last delta, as a message."""
+        engine = self.engine
+        heads, tails, born, gone = [], [], [], []
+        live = [engine.worm] + engine.aiWorms
+        liveSet = set(live)
+        for worm in [worm for worm in self.sent if worm not in liveSet]:
+            gone.append(self.wormIds.pop(worm))
+            del self.sent[worm]
+            self.wormSeats.pop(worm, None)
+        for worm in live:
+            head, length = worm.head(), len(worm)
+            last = self.sent.get(worm)
+            if last is None:
+                self.wormIds[worm] = self.nextWormId
+                self.nextWormId += 1
+                born.append(self.describe(worm))
+            elif last != (head, length):
+                wormId = self.wormIds[worm]
+                moved = head != last[0]
+                if moved:
+                    heads.append([wormId, head])
+                if last[1] + moved > length:
+                    tails.append([wormId, last[1] + moved - length])
+            self.sent[worm] = (head, length)
+
+        items = self.itemCells()
+        delta = {'t': engine.tick}
+        for key, values in (('h', heads), ('x', tails), ('w', born), ('k', gone),
+                            ('+', sorted(items - self.items)), ('-', sorted(self.items - items))):
+            if values:
+                delta[key] = values
+        self.items = items
+        return delta
+
+    def broadcast(self, message):
+        """Send a message to every client, encoded once for all of them."""
+        line = json.dumps(message, separators=(',', ':')).encode() + b'\n'
+        frame = websocketFrame(line)
+        for client in list(self.clients):
+            if not client.send(line, frame):
+                client.close()
+
+
+class WormyServer:
+    """Rooms by name, created on the first join and removed when the last client leaves."""
+
+    def __init__(self, cellWidth=BOARDWIDTH, cellHeight=BOARDHEIGHT, tickRate=TICKRATE, roomSize=ROOMSIZE):
+        self.cellWidth = cellWidth
+        self.cellHeight = cellHeight
+        self.tickRate = tickRate
+        self.roomSize = roomSize
+        self.rooms = {}
+        self.ticks = 0
+        self.busy = 0.0 # seconds spent stepping rooms
+        self.lateTicks = 0 # ticks dropped because stepping every room took too long
+
+    async def serve(self, host=HOST, port=PORT, statsInterval=None):
+        server = await asyncio.start_server(self.handleConnection, host, port)
+        async with server:
+            ticker = asyncio.ensure_future(self.tickRooms())
+            stats = asyncio.ensure_future(self.printStats(statsInterval)) if statsInterval else None
+            try:
+                await server.serve_forever()
+            finally:
+                ticker.cancel()
+                if stats:
+                    stats.cancel()
+
+    async def tickRooms(self):
+        """Step every room once a tick, all on the same clock."""
+        loop = asyncio.get_running_loop()
+        tickLength = 1.0 / self.tickRate
+        nextTick = loop.time()
+        while True:
+            nextTick += tickLength
+            started = time.perf_counter()
+            for room in list(self.rooms.values()):
+                room.step()
+            self.busy += time.perf_counter() - started
+            self.ticks += 1
+            delay = nextTick - loop.time()
+            if delay < -MAXLATETICKS * tickLength:
+                # Too far behind: let the rooms run slow rather than burst
+                self.lateTicks += int(-delay / tickLength)
+                nextTick = loop.time()
+                delay = 0
+            await asyncio.sleep(max(0.0, delay))
+
+    async def printStats(self, interval):
+        lastTicks, lastBusy = self.ticks, self.busy
+        while True:
+            await asyncio.sleep(interval)
+            ticks, busy = self.ticks - lastTicks, self.busy - lastBusy
+            lastTicks, lastBusy = self.ticks, self.busy
+            clients = sum(len(room.clients) for room in self.rooms.values())
+            print('%d rooms, %d clients: %.1f ticks/s, %.2f ms per tick, %d late ticks' % (
+                len(self.rooms), clients, ticks / interval, 1000.0 * busy / max(1, ticks), self.lateTicks))
+            sys.stdout.flush()
+
+    async def handleConnection(self, reader, writer):
+        client = None
+        try:
+            firstLine = await reader.readline()
+            websocket = firstLine.startswith(b'GET ')
+            if websocket:
+                if not await websocketHandshake(reader, writer):
+                    return
+                receive = lambda: readWebsocketMessage(reader, writer)
+                data = await receive()
+            else:
+                receive = reader.readline
+                data = firstLine
+            client = Client(writer, websocket)
+            while data and len(data) <= MAXMESSAGE:
+                message = json.loads(data)
+                if not isinstance(message, dict):
+                    break
+                if client.room is None and 'join' in message:
+                    self.joinRoom(client, str(message['join']))
+                elif client.seat is not None and message.get('turn') in DIRECTIONS:
+                    self.queueTurn(client, message['turn'])
+                data = await receive()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            if client and client.room:
+                self.leaveRoom(client)
+            writer.close()
+
+    def joinRoom(self, client, name):
+        room = self.rooms.get(name)
+        if room is None:
+            room = self.rooms[name] = Room(name, self.cellWidth, self.cellHeight, self.roomSize)
+        room.join(client)
+
+    def leaveRoom(self, client):
+        room = client.room
+        room.leave(client)
+        if not room.clients:
+            del self.rooms[room.name]
+
+    def queueTurn(self, client, direction):
+        room = client.room
+        if client.seat == 0:
+            current = room.engine.direction
+        else:
+            worm = room.seatWorms.get(client.seat)
+            current = worm.direction if worm else None
+        wormly.queueTurn(client.turns, direction, current)
+
+
+# Added minimal WebSocket support (RFC 6455 text frames, no extensions)
+async def websocketHandshake(reader, writer):
+    """Read the rest of an HTTP upgrade request and accept it; False if it isn't one."""
+    key = None
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'sec-websocket-key':
+            key = value.strip()
+    if key is None:
+        writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+        return False
+    accept = base64.b64encode(hashlib.sha1(key + WEBSOCKETGUID).digest())
+    writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                 b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+    return True
+
+
+async def readWebsocketMessage(reader, writer):
+    """The payload of the next text frame, answering pings on the way; b'' once the client closes."""
+    while True:
+        first, second = await reader.readexactly(2)
+        opcode, masked, length = first & 0x0f, second & 0x80, second & 0x7f
+        if length == 126:
+            length, = struct.unpack('>H', await reader.readexactly(2))
+        elif length == 127:
+            length, = struct.unpack('>Q', await reader.readexactly(8))
+        if length > MAXMESSAGE:
+            return b''
+        mask = await reader.readexactly(4) if masked else b'\0\0\0\0'
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(await reader.readexactly(length)))
+        if opcode == 0x8: # close
+            writer.write(websocketFrame(b'', 0x8))
+            return b''
+        if opcode == 0x9: # ping
+            writer.write(websocketFrame(payload, 0xa))
+        elif opcode in (0x1, 0x2):
+            return payload
+
+
+def websocketFrame(payload, opcode=0x1):
+    """One unmasked, unfragmented frame, as a server sends them."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('>BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+# Added loopback load test
+async def runLoadTest(host=HOST, port=PORT, numRooms=100, clientsPerRoom=2, seconds=10.0, turnRate=2.0):
+    """
+    Fill numRooms rooms with TCP clients that turn at random about
+    turnRate times a second, and return how many ticks and bytes each
+    client received per second.
+    """
+    received = []
+
+    async def play(room, number):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(json.dumps({'join': 'load-%d' % room}).encode() + b'\n')
+        counts = [0, 0] # messages, bytes
+        received.append(counts)
+        rng = random.Random(room * 1000 + number)
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                line = await reader.readline()
+                if not line:
+                    break
+                counts[0] += 1
+                counts[1] += len(line)
+                if rng.random() < turnRate / TICKRATE:
+                    writer.write(b'{"turn":"%s"}\n' % rng.choice(DIRECTIONS).encode())
+        finally:
+            writer.close()
+
+    await asyncio.gather(*[play(room, number) for room in range(numRooms) for number in range(clientsPerRoom)])
+    messages = [counts[0] / seconds for counts in received]
+    sizes = [counts[1] / seconds for counts in received]
+    return {'clients': len(received),
+            'messagesPerSecond': wormly.summarize(messages),
+            'bytesPerSecond': wormly.summarize(sizes)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Wormy multiplayer server')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--board', type=wormly.boardSize, default=(BOARDWIDTH, BOARDHEIGHT), metavar='WxH',
+                        help='board size in cells of every room')
+    parser.add_argument('--room-size', type=int, default=ROOMSIZE, help='seats per room')
+    parser.add_argument('--stats', type=float, metavar='SECONDS',
+                        help='print the tick rate and cost this often')
+    parser.add_argument('--load', type=int, metavar='ROOMS',
+                        help='instead of serving, fill this many rooms of a running server with bots')
+    parser.add_argument('--clients', type=int, default=2, help='clients per room for --load')
+    parser.add_argument('--seconds', type=float, default=10.0, help='how long --load runs')
+    args = parser.parse_args(argv)
+
+    if args.load:
+        stats = asyncio.run(runLoadTest(args.host, args.port, args.load, args.clients, args.seconds))
+        print('%d clients' % stats['clients'])
+        for field in ('messagesPerSecond', 'bytesPerSecond'):
+            summary = stats[field]
+            print('%-18s mean %9.1f  p10 %9.1f  p50 %9.1f  p90 %9.1f' % (
+                field, summary['mean'], summary['p10'], summary['p50'], summary['p90']))
+    else:
+        server = WormyServer(*args.board, roomSize=args.room_size)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.stats))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+# Vectorized Wormy: thousands of boards stepped at once with NumPy
+# Same rules as wormly.WormyEngine, for training and evaluating worm
+# control policies without a Python loop per board. The second worm
+# wanders at random as AI worms do in WormyEngine with AIPATHFINDING off.
+
+import math
+import numpy as np
+from wormly import UP, DOWN, LEFT, RIGHT, CELLWIDTH, CELLHEIGHT, TICKRATE, SPAWNATTEMPTS, calculateFinalScore
+
+# Action codes are indices into ACTIONS; KEEP carries on straight ahead.
+ACTIONS = (UP, DOWN, LEFT, RIGHT)
+KEEP = -1
+DX = np.array([0, 0, -1, 1])
+DY = np.array([-1, 1, 0, 0])
+OPPOSITE = np.array([1, 0, 3, 2])
+TURNS = np.array([[d for d in range(4) if d != OPPOSITE[c]] for c in range(4)]) # non-reversing choices
+
+NOCELL = -1 # an empty item slot or a failed spawn
+NEVER = np.iinfo(np.int64).max # a timer that is not running
+SPAWNTRIES = 4 # random cells tried per spawn before picking from the free cells directly
+
+# Columns of the observation array returned by reset() and step()
+OBSFIELDS = ('headX', 'headY', 'direction', 'appleX', 'appleY', 'length',
+             'dangerUp', 'dangerDown', 'dangerLeft', 'dangerRight', 'secondWorm')
+
+
+class VecWormyEnv:
+    """
+    numBoards independent Wormy games held as NumPy arrays and advanced
+    together by step(actions).
+
+    Each board has occupancy grids for both worms, a use count per cell
+    (worm segments plus items, like wormly.FreeCells), ring buffers for
+    both worm bodies, and item cells and timers in small fixed slots.
+    Boards that end are scored and reset in place, so every call steps
+    all boards.
+    """
+
+    def __init__(self, numBoards, cellWidth=CELLWIDTH, cellHeight=CELLHEIGHT, tickRate=TICKRATE, seed=None):
+        self.numBoards = numBoards
+        self.cellWidth = cellWidth
+        self.cellHeight = cellHeight
+        self.tickRate = tickRate
+        self.numCells = cellWidth * cellHeight
+        self.capacity = self.numCells + 1 # a worm can't be longer than the board plus its new head
+        self.rows = np.arange(numBoards)
+        self.rng = np.random.default_rng(seed)
+
+        n, cells = numBoards, self.numCells
+        self.tick = np.zeros(n, np.int64)
+        self.use = np.zeros((n, cells), np.uint8)
+        self.wormGrid = np.zeros((n, cells), np.uint8)
+        self.wormBody = np.zeros((n, self.capacity), np.int32)
+        self.wormHead = np.zeros(n, np.int64) # ring position of the head
+        self.wormLength = np.zeros(n, np.int64)
+        self.direction = np.zeros(n, np.int64)
+        self.secondGrid = np.zeros((n, cells), np.uint8)
+        self.secondBody = np.zeros((n, self.capacity), np.int32)
+        self.secondHead = np.zeros(n, np.int64)
+        self.secondLength = np.zeros(n, np.int64)
+        self.secondDirection = np.zeros(n, np.int64)
+        self.secondAlive = np.zeros(n, bool)
+        self.secondSpawned = np.zeros(n, bool)
+        self.apple = np.zeros(n, np.int64)
+        self.type1 = np.zeros((n, 3), np.int64)
+        self.type1Tick = np.zeros((n, 3), np.int64)
+        self.nextType1 = np.zeros(n, np.int64)
+        self.type2 = np.zeros(n, np.int64)
+        self.type2Tick = np.zeros(n, np.int64)
+        self.type2Spawned = np.zeros(n, bool)
+        self.poison = np.zeros((n, 5), np.int64)
+        self.numPoison = np.zeros(n, np.int64)
+        self.poisonNext = np.zeros(n, np.int64)
+        self.poisonExpire = np.zeros(n, np.int64)
+        self.blinkingItemsEaten = np.zeros(n, np.int64)
+        self.score = np.zeros(n, np.int64)
+        self.reset()
+
+    def ticks(self, seconds):
+        """The first tick at least this many seconds into a game."""
+        return math.ceil(seconds * self.tickRate)
+
+    def reset(self, seed=None):
+        """Start a new game on every board and return the observations."""
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.resetBoards(self.rows)
+        return self.observe()
+
+    def resetBoards(self, rows):
+        k = len(rows)
+        if k == 0:
+            return
+        rng = self.rng
+        self.use[rows] = 0
+        self.wormGrid[rows] = 0
+        self.secondGrid[rows] = 0
+        self.tick[rows] = 0
+
+        # Three segments facing right from a random start point
+        startx = rng.integers(5, self.cellWidth - 5, k)
+        starty = rng.integers(5, self.cellHeight - 5, k)
+        start = starty * self.cellWidth + startx
+        segments = np.stack([start, start - 1, start - 2], axis=1)
+        self.wormBody[rows, :3] = segments
+        self.wormHead[rows] = 0
+        self.wormLength[rows] = 3
+        self.wormGrid[rows[:, None], segments] = 1
+        self.use[rows[:, None], segments] = 1
+        self.direction[rows] = 3 # RIGHT
+
+        self.secondLength[rows] = 0
+        self.secondAlive[rows] = False
+        self.secondSpawned[rows] = False
+
+        self.apple[rows] = self.spawn(rows)
+        self.type1[rows] = NOCELL
+        self.nextType1[rows] = self.ticks(5.0)
+        self.type2[rows] = NOCELL
+        self.type2Spawned[rows] = False
+        self.poison[rows] = NOCELL
+        self.numPoison[rows] = rng.integers(1, 6, k)
+        self.poisonNext[rows] = np.ceil(rng.integers(10, 21, k) * self.tickRate).astype(np.int64)
+        self.poisonExpire[rows] = NEVER
+        self.blinkingItemsEaten[rows] = 0
+        self.score[rows] = 0
+
+    def sampleFree(self, rows):
+        """A uniformly random free cell on each board, NOCELL where it is full."""
+        rng = self.rng
+        cells = rng.integers(0, self.numCells, len(rows))
+        taken = self.use[rows, cells] != 0
+        for _ in range(SPAWNTRIES):
+            if not taken.any():
+                return cells
+            retry = np.flatnonzero(taken)
+            cells[retry] = rng.integers(0, self.numCells, len(retry))
+            taken[retry] = self.use[rows[retry], cells[retry]] != 0
+        if taken.any():
+            # Crowded boards: draw directly from their free cells
+            retry = np.flatnonzero(taken)
+            keys = rng.random((len(retry), self.numCells))
+            keys[self.use[rows[retry]] != 0] = -1.0
+            picks = keys.argmax(axis=1)
+            cells[retry] = np.where(keys[np.arange(len(retry)), picks] >= 0, picks, NOCELL)
+        return cells
+
+    def spawn(self, rows):
+        """Claim a random free cell on each board for a new item."""
+        cells = self.sampleFree(rows)
+        placed = cells >= 0
+        self.use[rows[placed], cells[placed]] += 1
+        return cells
+
+    def release(self, rows, cells):
+        self.use[rows, cells] -= 1
+
+    def popTail(self, rows, body, head, length, grid):
+        tail = body[rows, (head[rows] + length[rows] - 1) % self.capacity]
+        length[rows] -= 1
+        grid[rows, tail] -= 1
+        self.use[rows, tail] -= 1
+
+    def pushHead(self, rows, cells, body, head, length, grid):
+        head[rows] = (head[rows] - 1) % self.capacity
+        body[rows, head[rows]] = cells
+        length[rows] += 1
+        grid[rows, cells] += 1
+        self.use[rows, cells] += 1
+
+    def step(self, actions):
+        """
+        Advance every board by one tick.
+
+        actions holds one code per board: an index into ACTIONS, or KEEP.
+        Reversals are ignored like in WormyEngine.step(). Returns
+        (observations, rewards, dones, finalScores): rewards are the change
+        in calculateFinalScore(), and finalScores holds the final score of
+        each board that ended this tick (those boards start over).
+        """
+        self.runEvents()
+        dead, finalScores = self.moveWorms(np.asarray(actions))
+        self.moveSecondWorms(~dead)
+        self.tick += 1
+
+        score = calculateFinalScore(self.wormLength - 3, self.blinkingItemsEaten)
+        score[dead] = finalScores[dead]
+        rewards = score - self.score
+        self.score = score
+        self.resetBoards(np.flatnonzero(dead))
+        return self.observe(), rewards, dead, np.where(dead, finalScores, 0)
+
+    def runEvents(self):
+        """The spawns and expirations of WormyEngine's events, in EVENTORDER."""
+        tick = self.tick
+        cellWidth = self.cellWidth
+
+        # Spawn second worm after 20 seconds, away from the edges
+        pending = np.flatnonzero(~self.secondSpawned & (tick >= self.ticks(20)))
+        for _ in range(SPAWNATTEMPTS):
+            if len(pending) == 0:
+                break
+            cells = self.sampleFree(pending)
+            x, y = cells % cellWidth, cells // cellWidth
+            fits = ((cells >= 0) & (x >= 5) & (x <= cellWidth - 6) & (y >= 5) & (y <= self.cellHeight - 6))
+            fits[fits] &= ((self.use[pending[fits], cells[fits] - 1] == 0)
+                           & (self.use[pending[fits], cells[fits] - 2] == 0))
+            rows, cells = pending[fits], cells[fits]
+            segments = np.stack([cells, cells - 1, cells - 2], axis=1)
+            self.secondBody[rows, :3] = segments
+            self.secondHead[rows] = 0
+            self.secondLength[rows] = 3
+            self.secondGrid[rows[:, None], segments] = 1
+            self.use[rows[:, None], segments] += 1
+            self.secondDirection[rows] = self.rng.integers(0, 4, len(rows))
+            self.secondAlive[rows] = True
+            self.secondSpawned[rows] = True
+            pending = pending[~fits]
+
+        # Respawn the apple where the board was too full to place it
+        rows = np.flatnonzero(self.apple < 0)
+        if len(rows):
+            self.apple[rows] = self.spawn(rows)
+
+        # Type 1 blinking items expire after 5 seconds
+        expired = (self.type1 >= 0) & (tick[:, None] >= self.type1Tick + self.ticks(5.0))
+        if expired.any():
+            rows, slots = np.nonzero(expired)
+            self.release(rows, self.type1[rows, slots])
+            self.type1[rows, slots] = NOCELL
+
+        # A new type 1 item every 5 seconds while there are less than 3 blinking items
+        blinkingItems = (self.type1 >= 0).sum(axis=1) + (self.type2 >= 0)
+        rows = np.flatnonzero((tick >= self.nextType1) & (blinkingItems < 3))
+        if len(rows):
+            cells = self.spawn(rows)
+            placed = cells >= 0
+            rows, cells = rows[placed], cells[placed]
+            slots = (self.type1[rows] < 0).argmax(axis=1)
+            self.type1[rows, slots] = cells
+            self.type1Tick[rows, slots] = tick[rows]
+            self.nextType1[rows] = tick[rows] + self.ticks(5.0)
+
+        # The type 2 item appears once after 2 seconds and lasts 7
+        blinkingItems = (self.type1 >= 0).sum(axis=1) + (self.type2 >= 0)
+        rows = np.flatnonzero(~self.type2Spawned & (tick >= self.ticks(2.0)) & (blinkingItems < 3))
+        if len(rows):
+            cells = self.spawn(rows)
+            placed = cells >= 0
+            rows = rows[placed]
+            self.type2[rows] = cells[placed]
+            self.type2Tick[rows] = tick[rows]
+            self.type2Spawned[rows] = True
+        rows = np.flatnonzero((self.type2 >= 0) & (tick >= self.type2Tick + self.ticks(7.0)))
+        if len(rows):
+            self.release(rows, self.type2[rows])
+            self.type2[rows] = NOCELL
+
+        # Poisonous apples: a set of numPoison for 5 seconds, then a fresh set
+        rows = np.flatnonzero(tick >= self.poisonNext)
+        if len(rows):
+            for slot in range(self.poison.shape[1]):
+                slotRows = rows[self.numPoison[rows] > slot]
+                self.poison[slotRows, slot] = self.spawn(slotRows)
+            self.poisonNext[rows] = NEVER
+            self.poisonExpire[rows] = tick[rows] + self.ticks(5.0)
+        rows = np.flatnonzero(tick >= self.poisonExpire)
+        if len(rows):
+            placed = self.poison[rows] >= 0
+            self.release(np.repeat(rows, placed.sum(axis=1)), self.poison[rows][placed])
+            self.poison[rows] = NOCELL
+            self.poisonExpire[rows] = NEVER
+            self.poisonNext[rows] = tick[rows] + 1
+
+    def moveWorms(self, actions):
+        """Move every player worm; returns (dead, finalScores) arrays."""
+        cellWidth = self.cellWidth
+        rows = self.rows
+        turn = (actions >= 0) & (actions != OPPOSITE[self.direction])
+        self.direction = np.where(turn, actions, self.direction)
+
+        head = self.wormBody[rows, self.wormHead]
+        headx = head % cellWidth + DX[self.direction]
+        heady = head // cellWidth + DY[self.direction]
+        wall = (headx < 0) | (headx >= cellWidth) | (heady < 0) | (heady >= self.cellHeight)
+        newHead = np.where(wall, 0, heady * cellWidth + headx)
+        dead = wall | (self.wormGrid[rows, newHead] > 0)
+        # Like WormyEngine, the score at a crash counts the new head
+        baseScores = np.where(dead, self.wormLength + 1 - 3, 0)
+
+        moving = np.flatnonzero(~dead)
+        heads = newHead[moving]
+        self.pushHead(moving, heads, self.wormBody, self.wormHead, self.wormLength, self.wormGrid)
+
+        # Poisonous apples take 2 segments; a worm that can't spare them dies
+        hits = self.poison[moving] == heads[:, None]
+        poisonEaten = hits.any(axis=1)
+        if poisonEaten.any():
+            rows, slots = np.nonzero(hits)
+            rows = moving[rows]
+            self.release(rows, self.poison[rows, slots])
+            self.poison[rows, slots] = NOCELL
+            self.popTail(rows, self.wormBody, self.wormHead, self.wormLength, self.wormGrid)
+            poisoned = rows[self.wormLength[rows] <= 3]
+            self.popTail(rows[self.wormLength[rows] > 3], self.wormBody, self.wormHead,
+                         self.wormLength, self.wormGrid)
+            dead[poisoned] = True
+            baseScores[poisoned] = self.wormLength[poisoned] - 3
+            alive = ~dead[moving]
+            moving, heads, poisonEaten = moving[alive], heads[alive], poisonEaten[alive]
+
+        # Blinking items, worth 3 points each
+        hits = self.type1[moving] == heads[:, None]
+        if hits.any():
+            rows, slots = np.nonzero(hits)
+            rows = moving[rows]
+            self.blinkingItemsEaten[rows] += 1
+            self.release(rows, self.type1[rows, slots])
+            self.type1[rows, slots] = NOCELL
+        rows = moving[self.type2[moving] == heads]
+        if len(rows):
+            self.blinkingItemsEaten[rows] += 1
+            self.release(rows, self.type2[rows])
+            self.type2[rows] = NOCELL
+
+        # Grow by touching the second worm or by eating the apple
+        grows = self.secondAlive[moving] & (self.secondGrid[moving, heads] > 0)
+        appleEaten = self.apple[moving] == heads
+        if appleEaten.any():
+            rows = moving[appleEaten]
+            self.release(rows, self.apple[rows])
+            self.apple[rows] = self.spawn(rows)
+        rows = moving[~(appleEaten | poisonEaten | grows)]
+        self.popTail(rows, self.wormBody, self.wormHead, self.wormLength, self.wormGrid)
+
+        finalScores = calculateFinalScore(baseScores, self.blinkingItemsEaten)
+        return dead, finalScores
+
+    def moveSecondWorms(self, running):
+        cellWidth = self.cellWidth
+        rows = np.flatnonzero(running & self.secondAlive)
+        if len(rows) == 0:
+            return
+
+        # Randomly change direction occasionally (30% chance each tick)
+        change = self.rng.random(len(rows)) < 0.3
+        choice = self.rng.integers(0, 3, len(rows))
+        direction = self.secondDirection[rows]
+        direction = np.where(change, TURNS[direction, choice], direction)
+        self.secondDirection[rows] = direction
+
+        head = self.secondBody[rows, self.secondHead[rows]]
+        headx = head % cellWidth + DX[direction]
+        heady = head // cellWidth + DY[direction]
+        wall = (headx < 0) | (headx >= cellWidth) | (heady < 0) | (heady >= self.cellHeight)
+        heads = np.where(wall, 0, heady * cellWidth + headx)
+        dies = wall | (self.secondGrid[rows, heads] > 0)
+
+        # A second worm that hits the edge or itself is removed
+        dying = rows[dies]
+        if len(dying):
+            self.use[dying] -= self.secondGrid[dying]
+            self.secondGrid[dying] = 0
+            self.secondLength[dying] = 0
+            self.secondAlive[dying] = False
+
+        rows, heads = rows[~dies], heads[~dies]
+        self.pushHead(rows, heads, self.secondBody, self.secondHead, self.secondLength, self.secondGrid)
+        grows = self.wormGrid[rows, heads] > 0
+        appleEaten = self.apple[rows] == heads
+        if appleEaten.any():
+            eaters = rows[appleEaten]
+            self.release(eaters, self.apple[eaters])
+            self.apple[eaters] = self.spawn(eaters)
+        rows = rows[~(appleEaten | grows) & (self.secondLength[rows] > 3)]
+        self.popTail(rows, self.secondBody, self.secondHead, self.secondLength, self.secondGrid)
+
+    def observe(self):
+        """One row of OBSFIELDS per board, as an int32 array."""
+        cellWidth, cellHeight = self.cellWidth, self.cellHeight
+        rows = self.rows
+        head = self.wormBody[rows, self.wormHead]
+        headx, heady = head % cellWidth, head // cellWidth
+        hasApple = self.apple >= 0
+        columns = [headx, heady, self.direction,
+                   np.where(hasApple, self.apple % cellWidth, -1),
+                   np.where(hasApple, self.apple // cellWidth, -1),
+                   self.wormLength]
+        for d in range(4):
+            x, y = headx + DX[d], heady + DY[d]
+            wall = (x < 0) | (x >= cellWidth) | (y < 0) | (y >= cellHeight)
+            cells = np.where(wall, 0, y * cellWidth + x)
+            columns.append(wall | (self.wormGrid[rows, cells] > 0))
+        columns.append(self.secondAlive)
+        return np.stack(columns, axis=1).astype(np.int32)
+
+    def grids(self):
+        """
+        Every board as a (numBoards, cellHeight, cellWidth) uint8 array:
+        0 empty, 1 worm, 2 second worm, 3 apple, 4 poison, 5 blinking item.
+        """
+        grids = np.zeros((self.numBoards, self.numCells), np.uint8)
+        grids[self.secondGrid > 0] = 2
+        grids[self.wormGrid > 0] = 1
+        for code, cells in ((3, self.apple[:, None]), (4, self.poison),
+                            (5, self.type1), (5, self.type2[:, None])):
+            rows, slots = np.nonzero(cells >= 0)
+            grids[rows, cells[rows, slots]] = code
+        return grids.reshape(self.numBoards, self.cellHeight, self.cellWidth)